@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# coding=utf8
+""" Benchmarks the stages of patch.py on synthetic source fonts, one case per
+bundled symbol font option plus --complete. Run with
+`fontforge -script benchmark.py -o results.json` and compare two runs with
+`fontforge -script benchmark.py --compare results.json` """
+
+import sys
+from os.path import dirname, abspath, join
+from argparse import ArgumentParser
+from time import perf_counter
+from tempfile import mkdtemp
+from shutil import rmtree
+from itertools import chain
+from statistics import median
+import platform
+import json
+
+sys.path.insert(0, dirname(abspath(__file__)))
+import patch
+patch.checkFontForgeAvailable()
+import fontforge
+
+# FontPatcher methods timed as stages, a patch set entry is timed per name
+STAGES = (
+'analyzeSourceFont', 'setupFontNames', 'removeLigatures', 'setupPatchSet',
+'getSourceFontDimensions', 'setSourceFontGlyphWidths', 'generateFont')
+
+
+def buildSyntheticFont(path, glyphCount, em, width):
+	""" Generates a source font of glyphCount rectangle glyphs at path. Every
+	fifth glyph is double width and the combining marks have zero width, so
+	--mono has glyphs to adjust """
+	font = fontforge.font()
+	font.em = em
+	font.encoding = 'UnicodeFull'
+	font.fontname = "Benchmark-Regular"
+	font.familyname = "Benchmark"
+	font.fullname = "Benchmark Regular"
+	font.appendSFNTName('English (US)', 'SubFamily', 'Regular')
+	font.os2_winascent = int(em * 0.8)
+	font.os2_windescent = int(em * 0.2)
+	# Latin first so the dimensions come from real slots, then combining marks,
+	# then CJK ideographs for as many glyphs as needed
+	codepoints = chain(
+	range(0x21, 0x7f), range(0xa1, 0x17f), range(0x300, 0x370), range(0x4e00, 0xa000))
+	for index, codepoint in zip(range(glyphCount), codepoints):
+		glyph = font.createChar(codepoint)
+		if 0x300 <= codepoint < 0x370:
+			glyphWidth = 0
+			(xmin, xmax) = (-width * 0.4, -width * 0.1)
+		else:
+			glyphWidth = width * 2 if index % 5 == 4 else width
+			(xmin, xmax) = (glyphWidth * 0.1, glyphWidth * 0.9)
+		pen = glyph.glyphPen()
+		pen.moveTo((xmin, 0))
+		pen.lineTo((xmin, em * 0.7))
+		pen.lineTo((xmax, em * 0.7))
+		pen.lineTo((xmax, 0))
+		pen.closePath()
+		pen = None # finalizes the outline
+		glyph.width = glyphWidth
+	font.generate(path)
+	font.close()
+
+
+def timeMethods(timings):
+	""" Wraps the stage methods of patch.FontPatcher so that each call adds its
+	duration to timings, keyed by stage name """
+
+	def timed(method, getName):
+		def timedMethod(self, *args, **kwargs):
+			start = perf_counter()
+			try:
+				return method(self, *args, **kwargs)
+			finally:
+				name = getName(args)
+				timings[name] = timings.get(name, 0) + perf_counter() - start
+
+		return timedMethod
+
+	for stage in STAGES:
+		setattr(patch.FontPatcher, stage, timed(getattr(patch.FontPatcher, stage),
+		lambda args, stage=stage: stage))
+	patch.FontPatcher.planGlyphs = timed(patch.FontPatcher.planGlyphs,
+	lambda args: "plan " + args[0]['Name'])
+	patch.FontPatcher.applyGlyphs = timed(patch.FontPatcher.applyGlyphs,
+	lambda args: "apply " + args[0]['name'])
+
+
+def runCase(fontPath, outputDir, options, benchmarkArgs, timings):
+	""" Patches fontPath with options once, returns the stage timings """
+	timings.clear()
+	args, symFontArgs = patch.parseArguments(
+	[fontPath, '--mono', '--quiet', '--outputdir', outputDir,
+	'--buildprofile', benchmarkArgs.buildProfile,
+	'--mathbackend', benchmarkArgs.mathBackend] + options)
+	start = perf_counter()
+	with patch.FontPatcher(args, symFontArgs) as patcher:
+		patcher.patch()
+	timings['total'] = perf_counter() - start
+	return dict(timings)
+
+
+def runBenchmark(args):
+	""" Runs every case args.repeat times, returns the results dict with the
+	median duration of each stage """
+	_, symFontGroup = patch.getArgumentParser()
+	cases = [[action.option_strings[0]] for action in symFontGroup._group_actions]
+	cases.append(['--complete'])
+	if args.cases:
+		cases = [case for case in cases if case[0].lstrip('-') in args.cases]
+
+	timings = {}
+	timeMethods(timings)
+	workDir = mkdtemp(prefix="nf-benchmark-")
+	try:
+		fontPath = join(workDir, "Benchmark-Regular.ttf")
+		buildSyntheticFont(fontPath, args.glyphs, args.em, args.width)
+		results = {
+		'version': patch.VERSION, 'fontforge': fontforge.version(),
+		'python': platform.python_version(), 'glyphs': args.glyphs, 'em': args.em,
+		'width': args.width, 'repeat': args.repeat,
+		'buildprofile': args.buildProfile, 'mathbackend': args.mathBackend,
+		'cases': {}}
+		for case in cases:
+			runs = []
+			for _ in range(args.repeat):
+				runs.append(runCase(fontPath, join(workDir, "out"), case, args, timings))
+			results['cases'][" ".join(case)] = {
+			stage: median(run.get(stage, 0) for run in runs)
+			for stage in runs[0]}
+			print("{:<28} {:8.3f}s".format(" ".join(case),
+			results['cases'][" ".join(case)]['total']))
+	finally:
+		if args.keep:
+			print("Kept synthetic font and outputs in {}".format(workDir))
+		else:
+			rmtree(workDir, ignore_errors=True)
+	return results
+
+
+def compareResults(baseline, results, threshold, minTime):
+	""" Returns the stages of results slower than in baseline by more than
+	threshold (a fraction), ignoring stages faster than minTime seconds """
+	regressions = []
+	for case, stages in sorted(results['cases'].items()):
+		for stage, duration in sorted(stages.items()):
+			before = baseline.get('cases', {}).get(case, {}).get(stage)
+			if before is None or max(before, duration) < minTime:
+				continue
+			if duration > before * (1 + threshold):
+				regressions.append((case, stage, before, duration))
+	return regressions
+
+
+def main():
+	""" entry point """
+	parser = ArgumentParser(description='Benchmarks the stages of patch.py')
+	parser.add_argument('-g', '--glyphs', dest='glyphs', default=2000, type=int,
+	help='Number of glyphs in the synthetic source font (default 2000)')
+	parser.add_argument('--em', dest='em', default=1000, type=int,
+	help='Em size of the synthetic source font (default 1000)')
+	parser.add_argument('--width', dest='width', default=600, type=int,
+	help='Advance width of the synthetic source font (default 600)')
+	parser.add_argument('-r', '--repeat', dest='repeat', default=3, type=int,
+	help='Runs per case, the median is reported (default 3)')
+	parser.add_argument('--cases', dest='cases', nargs='+', default=None,
+	help='Only run these cases, e.g. material powerline complete')
+	parser.add_argument('--buildprofile', dest='buildProfile', default='release',
+	choices=sorted(patch.GENERATE_FLAGS), help='Build profile to patch with '
+	'(default release)')
+	parser.add_argument('--mathbackend', dest='mathBackend', default='scalar',
+	choices=('scalar', 'numpy'), help='Math backend to patch with (default scalar)')
+	parser.add_argument('-o', '--output', dest='output', default=None,
+	help='Write the results as json to this file')
+	parser.add_argument('--compare', dest='compare', default=None,
+	help='Results file of an earlier run to check for regressions')
+	parser.add_argument('--threshold', dest='threshold', default=0.2, type=float,
+	help='Allowed slowdown per stage as a fraction (default 0.2)')
+	parser.add_argument('--mintime', dest='minTime', default=0.05, type=float,
+	help='Ignore stages faster than this many seconds (default 0.05)')
+	parser.add_argument('--keep', dest='keep', default=False, action='store_true',
+	help='Keep the synthetic font and the patched outputs')
+	args = parser.parse_args()
+
+	results = runBenchmark(args)
+	if args.output:
+		with open(args.output, "w") as outputFile:
+			json.dump(results, outputFile, indent=1, sort_keys=True)
+	if args.compare:
+		with open(args.compare) as baselineFile:
+			baseline = json.load(baselineFile)
+		regressions = compareResults(baseline, results, args.threshold, args.minTime)
+		for case, stage, before, duration in regressions:
+			print("Regression: {} {} {:.3f}s -> {:.3f}s".format(case, stage, before,
+			duration))
+		if regressions:
+			sys.exit(1)
+		print("No stage slower than {:.0%} over {}".format(args.threshold,
+		args.compare))
+
+
+if __name__ == "__main__":
+	main()
@@ -7,20 +7,70 @@ VERSION = "2.1.0"
 PROJECT_NAME = "Nerd Fonts"
 PROJECT_NAME_ABBR = "NF"
 PROJECT_NAME_SING = PROJECT_NAME[:-1]
+# Timestamp written into generated fonts when they must be reproducible
+# (2020-06-10, the FH_3.2 release), unless SOURCE_DATE_EPOCH is already set
+REPRODUCIBLE_EPOCH = 1591747200
+# Options that do not change the generated font, left out of output cache keys
+OUTPUT_CACHE_IGNORED_OPTIONS = (
+'font', 'outputdir', 'quiet', 'jobs', 'outputCache', 'glyphCache',
+'glyphCacheSize', 'planOut', 'checkTransforms', 'metricsCache', 'profile',
+'cprofile', 'progressbars', 'events', 'variants', 'resume', 'maxMemory',
+'timeout', 'mathBackend')
+# The only options a `patch.py serve` job may change. The others run programs
+# (--postprocess), read or write paths other than the output directory or
+# write to file descriptors of the server
+SERVE_JOB_OPTIONS = (
+'font', 'outputdir', 'single', 'adjustLineHeight', 'quiet', 'progressbars',
+'windows', 'complete', 'compat', 'careful', 'removeligatures', 'extension',
+'variants', 'dedup', 'mathBackend', 'checkTransforms', 'buildProfile',
+'profile', 'cprofile', 'fontawesome', 'fontawesomeextension', 'fontlinux',
+'octicons', 'powersymbols', 'pomicons', 'powerline', 'powerlineextra',
+'material', 'weather')
 
 import sys
 try:
 	import psMat
 except ImportError:
-	sys.exit(PROJECT_NAME + ": FontForge module is probably not installed. "
-	"[See: http://designwithfontforge.com/en-US/Installing_Fontforge.html]")
+	psMat = None # `patch.py verify` runs without it, see checkFontForgeAvailable
 from re import match
-from os.path import splitext, dirname, abspath, isdir, isfile, join
-from os import makedirs, listdir
+from os.path import splitext, dirname, abspath, isdir, isfile, join, basename, getsize, exists
+from os import makedirs, listdir, remove, replace, stat, utime, getpid, link, rename, environ, write
+from os import waitpid, _exit, pipe, fdopen, close, dup2, walk, read
+# os.fork, os.setpgid, os.killpg and os.sysconf only exist on POSIX, they are
+# looked up where they are called
+import os
+from shutil import copyfile, rmtree
 from argparse import RawTextHelpFormatter, ArgumentParser
 import errno
 import subprocess
 import json
+import multiprocessing
+from copy import copy
+import gzip
+import zlib
+from hashlib import sha256
+import traceback
+import struct
+import mmap
+import threading
+import signal
+import select
+import socketserver
+from io import TextIOWrapper
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+from contextlib import contextmanager
+from time import perf_counter, time
+import cProfile
+try:
+	import resource
+except ImportError:
+	resource = None # not available on Windows, peak RSS is not reported
+try:
+	import numpy
+except ImportError:
+	numpy = None # only needed for --mathbackend numpy
 try:
 	from configparser import ConfigParser
 except ImportError:
@@ -30,99 +80,528 @@ except ImportError:
 try:
 	import fontforge
 except ImportError:
-	sys.exit(PROJECT_NAME + (
-	": FontForge module could not be loaded. Try installing fontforge python bindings "
-	"[e.g. on Linux Debian or Ubuntu: `sudo apt install fontforge python-fontforge`]"
-	))
+	fontforge = None # `patch.py verify` runs without it, see checkFontForgeAvailable
+
+# Directory of this script, symbol fonts are read from its src/glyphs
+__dir__ = dirname(abspath(__file__))
+
+# Options each --variants entry may switch on, by variant name
+VARIANT_OPTIONS = {'mono': 'single', 'windows': 'windows', 'compat': 'compat'}
+
+# Flags fontforge generates fonts with, by --buildprofile. Drafts leave out
+# the comment and fontlog tables, hints and TrueType instructions
+GENERATE_FLAGS = {
+'release': ('opentype', 'PfEd-comments'),
+'draft': ('opentype', 'omit-instructions', 'no-hints', 'no-flex')}
+
+# Extensions of the fonts patched from a directory, in order of preference
+# when several files have the same full name
+FONT_EXTENSIONS = ('.otf', '.ttf', '.woff2', '.woff', '.sfd')
+# Journal of the fonts patched into an output directory, see --resume
+JOURNAL_NAME = "nerdfonts-journal.jsonl"
+
+# Seconds between the memory and time checks of isolated fonts, see
+# patchFontsIsolated
+LIMIT_POLL_INTERVAL = 0.25
+
+# File signature and arrays of an outline store, see saveOutlineStore
+OUTLINE_STORE_MAGIC = b"NFOUTLN1"
+OUTLINE_STORE_ARRAYS = (
+('unicodes', 'i'), ('encodings', 'i'), ('widths', 'd'), ('bboxes', 'd'),
+('contourStarts', 'i'), ('contourFlags', 'B'), ('pointStarts', 'i'),
+('points', 'd'), ('onCurve', 'B'))
+
+# Most progress bar redraws per second, see ProgressReporter
+PROGRESS_RATE = 10
+
+# Session shared by the fonts of a batch, inherited by forked workers
+batchSession = None
+# Symbol fonts kept open by `patch.py serve` for every job, keyed like
+# PatchSession.symbolFonts and inherited by its workers
+residentSymbolFonts = {}
+
+# Lookup tables compiled from a patch set entry, see compilePatchTable
+PatchTable = namedtuple('PatchTable', (
+'targets', 'attributes', 'attributeIds', 'scaleStarts', 'scaleEnds'))
+
+# The fontDim values the glyph placement depends on. xmax is not used and
+# differs between the weights of a family
+PLACEMENT_DIMENSIONS = ('xmin', 'ymin', 'ymax', 'width', 'height')
+
+# Codepoints and glyph names listed in an --icons file, see loadIconManifest
+IconManifest = namedtuple('IconManifest', ('codepoints', 'names'))
+
+
+class PatchSession:
+	""" State shared by every font patched in a run: the parsed config file, the
+	patch set, the glyph cache and the opened symbol fonts. Only the source font
+	changes between the fonts of a batch """
+
+	def __init__(self, args):
+		self.args = args # class 'argparse.Namespace'
+		self.config = ConfigParser(empty_lines_in_values=False, allow_no_value=True)
+		self.configRead = bool(args.configfile and self.config.read(args.configfile))
+		self.patchSet = getPatchSet(args) # class 'list'
+		self.patchTables = None # class 'list', compiled on first use
+		self.glyphCache = None # class 'GlyphCache'
+		if args.glyphCache:
+			self.glyphCache = GlyphCache(args.glyphCache,
+			args.glyphCacheSize * 1024 * 1024)
+		self.outputCache = None # class 'OutputCache'
+		if args.outputCache:
+			self.outputCache = OutputCache(args.outputCache)
+			# Cached fonts must be identical to freshly generated ones, so pin the
+			# timestamps fontforge writes (workers inherit the environment)
+			environ.setdefault("SOURCE_DATE_EPOCH", str(REPRODUCIBLE_EPOCH))
+		# Opened symbol fonts keyed by (filename, em), em is None for fonts
+		# preloaded at their own size
+		self.symbolFonts = {}
+		self.symbolFontHashes = {}
+		self.glyphsHash = None
+		# Symbol fonts read from --outlinestore instead, keyed by filename and
+		# em like symbolFonts
+		self.outlineStores = {} # class 'OutlineStore'
+		# Only the glyphs listed in the --icons file are patched
+		self.icons = None # class 'IconManifest'
+		self.iconsHash = None
+		if args.icons:
+			self.icons = loadIconManifest(args.icons)
+			self.iconsHash = getFileHash(args.icons)
+
+	def getSymbolFont(self, filename, em):
+		""" Returns the symbol font matching the em of the source font. Fonts stay
+		open for the whole session so entries using the same font, adjacent or
+		not, share it """
+		if self.args.outlineStore:
+			return StoredSymbolFont(self.getOutlineStore(filename, em))
+		key = (filename, em)
+		if key not in self.symbolFonts:
+			# A preloaded font is rescaled the first time it is needed, a second em
+			# gets a fresh copy as rescaling twice would accumulate rounding errors
+			symbolFont = self.symbolFonts.pop((filename, None), None)
+			if symbolFont is None:
+				symbolFont = fontforge.open(__dir__ + "/src/glyphs/" + filename)
+			# Match the symbol font size to the source font size
+			symbolFont.em = em
+			self.symbolFonts[key] = symbolFont
+		return self.symbolFonts[key]
+
+	def getUnscaledSymbolFont(self, filename):
+		""" Returns a symbol font at any size, for reading its encoding """
+		if self.args.outlineStore:
+			return StoredSymbolFont(self.getOutlineStore(filename))
+		for key, symbolFont in self.symbolFonts.items():
+			if key[0] == filename:
+				return symbolFont
+		symbolFont = fontforge.open(__dir__ + "/src/glyphs/" + filename)
+		self.symbolFonts[(filename, None)] = symbolFont
+		return symbolFont
+
+	def getSymbolCodepoints(self, patch):
+		""" Returns the unicode and encoding of each symbol font glyph selected
+		by a patch set entry, in selection order. Kept in the glyph cache if there
+		is one, so a cache hit does not need the symbol font """
+		cacheKey = None
+		if self.glyphCache:
+			cacheKey = sha256(json.dumps([
+			"codepoints", VERSION, self.getSymbolFontHash(patch['Filename']),
+			patch['SymStart'], patch['SymEnd']]).encode("utf-8")).hexdigest()
+			codepoints = self.glyphCache.get(cacheKey)
+			if codepoints is not None:
+				return codepoints
+		codepoints = [[glyph.unicode, glyph.encoding]
+		for glyph in selectSymbolGlyphs(self.getUnscaledSymbolFont(patch['Filename']),
+		patch['SymStart'], patch['SymEnd'])]
+		if cacheKey:
+			self.glyphCache.put(cacheKey, codepoints)
+		return codepoints
+
+	def getPatchTables(self):
+		""" Returns the PatchTable of each patch set entry, None for disabled
+		entries. Raises ValueError if two entries would patch the same slot """
+		if self.patchTables is not None:
+			return self.patchTables
+		patchTables = []
+		patchedSlots = {} # slot: name of the entry patching it
+		for patch in self.patchSet:
+			if not patch['Enabled']:
+				patchTables.append(None)
+				continue
+			if patch['SymStart'] == 0:
+				# All glyphs are copied carefully, keeping their own encoding
+				patchTables.append(compilePatchTable(patch, None))
+				continue
+			patchTable = compilePatchTable(patch, self.getSymbolCodepoints(patch))
+			if not self.args.careful:
+				for unicode, slot in patchTable.targets.items():
+					symAttr = patchTable.attributes[patchTable.attributeIds.get(unicode, 0)]
+					if 'careful' in symAttr['params']:
+						continue
+					if slot in patchedSlots:
+						raise ValueError("Glyph sets {} and {} both patch {:X}".format(
+						patchedSlots[slot], patch['Name'], slot))
+					patchedSlots[slot] = patch['Name']
+			patchTables.append(patchTable)
+		self.patchTables = patchTables
+		return patchTables
+
+	def getPreflightSlots(self):
+		""" Returns the name of each enabled patch set entry, in patch order,
+		with the slots it would write, each mapped to whether its glyph is copied
+		carefully. Unlike getPatchTables entries writing the same slot are not
+		rejected. With --icons only the listed codepoints are kept, glyph names
+		are not resolved """
+		preflightSlots = []
+		for patch in self.patchSet:
+			if not patch['Enabled']:
+				continue
+			codepoints = self.getSymbolCodepoints(patch)
+			slots = {}
+			if patch['SymStart'] == 0:
+				# All glyphs are copied carefully, keeping their own encoding
+				for unicode, encoding in codepoints:
+					if unicode >= 0:
+						slots[encoding] = True
+			else:
+				patchTable = compilePatchTable(patch, codepoints)
+				for unicode, slot in patchTable.targets.items():
+					symAttr = patchTable.attributes[patchTable.attributeIds.get(unicode, 0)]
+					slots[slot] = self.args.careful or 'careful' in symAttr['params']
+			if self.icons:
+				slots = {
+				slot: careful for slot, careful in slots.items()
+				if slot in self.icons.codepoints}
+			preflightSlots.append((patch['Name'], slots))
+		return preflightSlots
+
+	def getOutlineStore(self, filename, em=None):
+		""" Returns the OutlineStore of a symbol font scaled to em (None for its
+		own size) from the --outlinestore directory. Stores are named by the hash
+		of the font and the em, a changed font gets new stores extracted from it.
+		A store is extracted after fontforge rescaled the font, so its points,
+		widths and bounding boxes are those fontforge patches with """
+		key = (filename, em)
+		if key not in self.outlineStores:
+			makeSurePathExists(self.args.outlineStore)
+			name = self.getSymbolFontHash(filename)
+			if em is not None:
+				name += "-{}".format(em)
+			path = join(self.args.outlineStore, name + ".outlines")
+			store = loadOutlineStore(path)
+			if store is None:
+				symbolFont = fontforge.open(__dir__ + "/src/glyphs/" + filename)
+				if em is not None:
+					symbolFont.em = em
+				saveOutlineStore(symbolFont, path)
+				symbolFont.close()
+				store = loadOutlineStore(path)
+			self.outlineStores[key] = store
+		return self.outlineStores[key]
+
+	def getSymbolFontHash(self, filename):
+		""" Returns the sha256 hex digest of a symbol font file """
+		if filename not in self.symbolFontHashes:
+			self.symbolFontHashes[filename] = getFileHash(__dir__ + "/src/glyphs/" +
+			filename)
+		return self.symbolFontHashes[filename]
+
+	def getOutputCacheKey(self, args):
+		""" Returns the output cache key for patching args.font: a hash of the
+		font, the options that affect the output and every file they read """
+		keyHash = sha256()
+		if self.glyphsHash is None:
+			glyphsHash = sha256()
+			glyphsDir = __dir__ + "/src/glyphs"
+			for filename in sorted(listdir(glyphsDir)):
+				if isfile(join(glyphsDir, filename)):
+					glyphsHash.update(filename.encode("utf-8"))
+					glyphsHash.update(getFileHash(join(glyphsDir, filename)).encode("utf-8"))
+			self.glyphsHash = glyphsHash.hexdigest()
+		options = {
+		option: value
+		for option, value in vars(args).items()
+		if option not in OUTPUT_CACHE_IGNORED_OPTIONS}
+		# A fontforge release may generate the same font differently
+		keyHash.update(json.dumps([
+		VERSION, fontforge.version(), getFileHash(abspath(__file__)),
+		self.glyphsHash, getFileHash(args.font), options], sort_keys=True,
+		default=str).encode("utf-8"))
+		for option in ('configfile', 'postprocess', 'planIn', 'icons'):
+			if options.get(option) and isfile(options[option]):
+				keyHash.update(getFileHash(options[option]).encode("utf-8"))
+		return keyHash.hexdigest()
+
+	def preloadSymbolFonts(self):
+		""" Opens the symbol fonts of all enabled patch sets so that forked workers
+		share them copy-on-write instead of each opening them again """
+		for patch in self.patchSet:
+			key = (patch['Filename'], None)
+			if patch['Enabled'] and self.args.outlineStore:
+				self.getOutlineStore(patch['Filename'])
+			elif patch['Enabled'] and key not in self.symbolFonts:
+				self.symbolFonts[key] = fontforge.open(__dir__ + "/src/glyphs/" +
+				patch['Filename'])
+
+	def close(self):
+		""" Closes all symbol fonts opened by the session """
+		for symbolFont in self.symbolFonts.values():
+			symbolFont.close()
+		self.symbolFonts = {}
 
 
 class FontPatcher:
-	def __init__(self, args, symFontArgs):
+	def __init__(self, args, symFontArgs, session=None):
 		self.args = args # class 'argparse.Namespace'
 		self.symFontArgs = symFontArgs
+		# A patcher without a session gets its own, closed after patching
+		self.ownsSession = session is None
+		if self.ownsSession:
+			session = PatchSession(args)
+		self.session = session # class 'PatchSession'
 		self.sourceFont = None # class 'fontforge.font'
-		# For compatibility with the rest of nerdfonts we dont want to keep the
-		# encoding positions for the following
-		self.octiconsExactEncodingPosition = True
-		self.fontlinuxExactEncodingPosition = True
-		if args.compat:
-			self.octiconsExactEncodingPosition = False
-			self.fontlinuxExactEncodingPosition = False
 		self.patchSet = None # class 'list'
+		self.patchTables = None # class 'list'
 		self.fontDim = None # class 'dict'
 		self.onlybitmaps = 0
-		self.extension = ""
-		self.config = ConfigParser(empty_lines_in_values=False, allow_no_value=True)
-		self.sourceFont = fontforge.open(self.args.font)
-		self.setupFontNames()
-		self.removeLigatures()
-		makeSurePathExists(self.args.outputdir)
-		self.checkPositionConflicts()
-		self.setupPatchSet()
-		self.setupLineDimensions()
-		self.getSourceFontDimensions()
-		self.sourceFont.encoding = 'UnicodeFull' # Update the font encoding to
-		# ensure that the Unicode glyphs are available
-		self.onlybitmaps = self.sourceFont.onlybitmaps # Fetch this property
-		# before adding outlines. NOTE self.onlybitmaps initialized and never used
-		if self.args.extension == "":
-			self.extension = splitext(self.sourceFont.path)[1]
-		else:
-			self.extension = '.' + self.args.extension
+		self.extensions = [] # class 'list', one output file per extension
+		self.glyphCache = session.glyphCache # class 'GlyphCache'
+		self.cachedGlyphs = {} # glyph cache entries read while planning, by key
+		self.config = session.config
+		self.profiler = Profiler(args.profile or args.cprofile, args.cprofile)
+		self.progress = ProgressReporter(args)
+		# __exit__ does not run when __init__ raises, e.g. for a font fontforge
+		# can not open or patch sets that conflict
+		try:
+			with self.profiler.span("open"):
+				self.sourceFont = fontforge.open(self.args.font)
+			with self.profiler.span("analyzeSourceFont"):
+				self.metrics = self.analyzeSourceFont() # class 'FontMetrics'
+			if not self.args.variants:
+				# Every variant names the font itself, see patchVariants
+				with self.profiler.span("setupFontNames"):
+					self.setupFontNames()
+			with self.profiler.span("removeLigatures"):
+				self.removeLigatures()
+			makeSurePathExists(self.args.outputdir)
+			with self.profiler.span("setupPatchSet"):
+				self.setupPatchSet()
+			self.setupLineDimensions()
+			with self.profiler.span("getSourceFontDimensions"):
+				self.getSourceFontDimensions()
+			self.sourceFont.encoding = 'UnicodeFull' # Update the font encoding to
+			# ensure that the Unicode glyphs are available
+			self.onlybitmaps = self.sourceFont.onlybitmaps # Fetch this property
+			# before adding outlines. NOTE self.onlybitmaps initialized and never used
+			if self.args.extension:
+				self.extensions = ['.' + extension for extension in self.args.extension]
+			else:
+				self.extensions = [splitext(self.sourceFont.path)[1]]
+		except Exception:
+			self.close()
+			raise
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def close(self):
+		""" Closes the source font, and the session if the patcher owns it.
+		Patchers are used as context managers so that a batch does not keep
+		every font it patched open """
+		if self.sourceFont is not None:
+			self.sourceFont.close()
+			self.sourceFont = None
+		if self.ownsSession:
+			self.session.close()
 
 	def patch(self):
+		""" Patches the font and writes it, returns the output paths """
+		self.patchGlyphs()
+		return self.writeOutputs()
+
+	def patchGlyphs(self):
+		""" Adds the glyphs of every enabled patch set entry to the font """
 		if self.args.single:
 			# Force width to be equal on all glyphs to ensure the font is
 			# considered monospaced on Windows.
 			# This needs to be done on all characters, as some information
 			# seems to be lost from the original font file.
-			self.setSourceFontGlyphWidths()
-
-		# Prevent opening and closing the fontforge font. Makes things faster when patching
-		# multiple ranges using the same symbol font.
-		previousSymbolFilename = ""
-		symfont = None
-
-		for patch in self.patchSet:
-			if patch['Enabled']:
-				if previousSymbolFilename != patch['Filename']:
-					# We have a new symbol font, so close the previous one if it exists
-					if symfont:
-						symfont.close()
-						symfont = None
-					symfont = fontforge.open(__dir__ + "/src/glyphs/" + patch['Filename'])
-
-					# Match the symbol font size to the source font size
-					symfont.em = self.sourceFont.em
-					previousSymbolFilename = patch['Filename']
-
-				# If patch table doesn't include a source start and end, re-use
-				# the symbol font values
-				srcStart = patch['SrcStart']
-				srcEnd = patch['SrcEnd']
-				if not srcStart:
-					srcStart = patch['SymStart']
-				if not srcEnd:
-					srcEnd = patch['SymEnd']
-				self.copyGlyphs(srcStart, srcEnd, symfont, patch['SymStart'],
-				patch['SymEnd'], patch['Exact'], patch['ScaleGlyph'], patch['Name'],
-				patch['Attributes'])
-
-		if symfont:
-			symfont.close()
-		print("\nDone with Patch Sets, generating font...")
-
-		# the `PfEd-comments` flag is required for Fontforge to save '.comment' and '.fontlog'.
-		self.sourceFont.generate(
-		self.args.outputdir + "/" + self.sourceFont.fullname + self.extension,
-		flags=('opentype', 'PfEd-comments'))
-		print("\nGenerated: {}".format(self.sourceFont.fullname))
+			with self.profiler.span("setSourceFontGlyphWidths", hot=True) as span:
+				widthCounts = self.setSourceFontGlyphWidths()
+				span['glyphs'] = widthCounts['adjusted'] + widthCounts['marks']
+			self.progress.message(
+			"Set the width of {} Glyphs and {} zero width marks, {} already monospaced, "
+			"{} failed".format(widthCounts['adjusted'], widthCounts['marks'],
+			widthCounts['skipped'], widthCounts['failed']))
+			self.progress.event("glyphWidthsSet", **widthCounts)
+
+		# Resolve every enabled patch set entry into glyph operations first, then
+		# execute them. A plan made for a font with the same metrics can be reused
+		if self.args.planIn:
+			plan = loadPlan(self.args.planIn)
+			self.checkPlan(plan)
+			self.replanSlots(plan)
+		else:
+			plan = self.planPatch()
+		if self.args.planOut:
+			savePlan(plan, self.getPlanPath())
+		self.applyPlan(plan)
+		if self.args.dedup:
+			with self.profiler.span("dedupGlyphs", hot=True) as span:
+				glyphsSaved, bytesSaved = self.dedupGlyphs(plan)
+				span['glyphs'] = glyphsSaved
+				span['bytes'] = bytesSaved
+			self.progress.message(
+			"\nReplaced {} repeated Glyphs with references, about {} bytes saved".format(
+			glyphsSaved, bytesSaved))
+			self.progress.event("glyphsDeduplicated", glyphs=glyphsSaved,
+			bytes=bytesSaved)
+
+	def writeOutputs(self):
+		""" Generates the patched font in every requested format and runs the
+		post processing script on them. Returns the output paths """
+		if self.ownsSession:
+			self.session.close()
+		self.progress.message("\nDone with Patch Sets, generating font...")
+
+		outputPaths = [
+		self.args.outputdir + "/" + self.sourceFont.fullname + extension
+		for extension in self.extensions]
+		# Generate into new files, existing ones may be hard linked to the cache
+		for outputPath in outputPaths:
+			if isfile(outputPath):
+				remove(outputPath)
+		with self.profiler.span("generateFont", hot=True):
+			self.generateFonts(outputPaths)
+		self.progress.message("\nGenerated: {}".format(self.sourceFont.fullname))
 
 		if self.args.postprocess:
-			subprocess.call([
-			self.args.postprocess,
-			self.args.outputdir + "/" + self.sourceFont.fullname + self.extension])
-			print("\nPost Processed: {}".format(self.sourceFont.fullname))
+			with self.profiler.span("postprocess"):
+				for outputPath in outputPaths:
+					subprocess.call([self.args.postprocess, outputPath])
+			self.progress.message("\nPost Processed: {}".format(
+			self.sourceFont.fullname))
+		if self.profiler.enabled:
+			profilePath = self.args.outputdir + "/" + self.sourceFont.fullname
+			self.profiler.writeTrace(profilePath + ".trace.json")
+			if self.args.cprofile:
+				self.profiler.cProfile.dump_stats(profilePath + ".prof")
+			self.profiler.printSummary(self.sourceFont.fullname)
+		return outputPaths
+
+	def patchVariants(self, variants):
+		""" Produces one patched font per args in variants (see getVariantArgs)
+		from the loaded font, returns the output paths of each variant. Variants
+		that add the same glyphs, --mono and --compat being equal, are patched
+		once in a forked child which forks again to name and generate each of
+		them. Needs fork """
+		groups = {} # (single, compat): indexes into variants
+		for index, variantArgs in enumerate(variants):
+			groups.setdefault((variantArgs.single, variantArgs.compat), []).append(index)
+		if len(groups) > 1:
+			# Rescale the symbol fonts once, every group inherits them
+			for patch in self.patchSet:
+				if patch['Enabled']:
+					self.session.getSymbolFont(patch['Filename'], self.sourceFont.em)
+
+		readFd, writeFd = pipe()
+		pids = [
+		forkCall(lambda indexes=indexes: self.patchVariantGroup(variants, indexes,
+		writeFd), writeFd, indexes[0])
+		for indexes in groups.values()]
+		close(writeFd)
+		# Reaches the end once every child and grandchild has exited
+		with fdopen(readFd, "r", encoding="utf-8") as resultFile:
+			results = [json.loads(line) for line in resultFile]
+		for pid in pids:
+			waitpid(pid, 0)
+
+		outputs = [None] * len(variants)
+		errors = []
+		for result in results:
+			if 'error' in result:
+				errors.append(result['error'])
+			else:
+				outputs[result['index']] = result['outputs']
+		if errors or None in outputs:
+			raise RuntimeError("Failed to patch variants: {}".format(
+			"; ".join(errors) or "a variant process exited early"))
+		return outputs
+
+	def patchVariantGroup(self, variants, indexes, resultFd):
+		""" Patches the glyphs of the variants at indexes, which only differ in
+		their names, then names and writes each variant. Runs in a forked child,
+		see patchVariants """
+		self.setVariantArgs(variants[indexes[0]])
+		self.patchGlyphs()
+		pids = [
+		forkCall(lambda index=index: self.writeVariant(variants[index], index,
+		resultFd), resultFd, index)
+		for index in indexes[:-1]]
+		self.writeVariant(variants[indexes[-1]], indexes[-1], resultFd)
+		for pid in pids:
+			waitpid(pid, 0)
+
+	def setVariantArgs(self, variantArgs):
+		""" Switches self.args to those of a variant, rebuilding the patch set
+		if the variant changes --compat """
+		compatChanged = variantArgs.compat != self.args.compat
+		self.args = variantArgs
+		if compatChanged:
+			self.session.args = variantArgs
+			self.session.patchSet = getPatchSet(variantArgs)
+			self.session.patchTables = None
+			self.setupPatchSet()
+
+	def writeVariant(self, variantArgs, index, resultFd):
+		""" Names and writes the patched font as a variant, reporting the output
+		paths on resultFd """
+		self.args = variantArgs
+		with self.profiler.span("setupFontNames"):
+			self.setupFontNames()
+		outputPaths = self.writeOutputs()
+		write(resultFd, (json.dumps({'index': index, 'outputs': outputPaths}) +
+		"\n").encode("utf-8"))
+
+	def generateFonts(self, outputPaths):
+		""" Writes the patched self.sourceFont to each of outputPaths, in the
+		format of its extension. Where fork is available every format but the
+		last is generated by a child process, each working on its own copy of the
+		patched font, while this process generates the last one """
+		children = {}
+		if len(outputPaths) > 1 and "fork" in multiprocessing.get_all_start_methods():
+			# Pending output would be written again by every child
+			sys.stdout.flush()
+			sys.stderr.flush()
+			for outputPath in outputPaths[:-1]:
+				pid = os.fork()
+				if pid == 0:
+					status = 1
+					try:
+						self.generateFont(outputPath)
+						status = 0
+					except Exception:
+						traceback.print_exc()
+					finally:
+						sys.stderr.flush()
+						_exit(status)
+				children[pid] = outputPath
+			outputPaths = outputPaths[-1:]
+		for outputPath in outputPaths:
+			self.generateFont(outputPath)
+		failed = [
+		outputPath for pid, outputPath in children.items()
+		if waitpid(pid, 0)[1] != 0]
+		if failed:
+			raise RuntimeError("Failed to generate {}".format(", ".join(failed)))
+
+	def generateFont(self, outputPath):
+		""" Writes the patched self.sourceFont to outputPath """
+		# the `PfEd-comments` flag is required for Fontforge to save '.comment' and '.fontlog'.
+		self.sourceFont.generate(outputPath,
+		flags=GENERATE_FLAGS[self.args.buildProfile])
 
 	def setupFontNames(self):
 		verboseAdditionalFontNameSuffix = " " + PROJECT_NAME_SING
@@ -162,6 +641,12 @@ class FontPatcher:
 			additionalFontNameSuffix = " " + PROJECT_NAME_SING + " Complete"
 			verboseAdditionalFontNameSuffix = " " + PROJECT_NAME_SING + " Complete"
 
+		# a subset is named after its manifest, e.g. "Subset Terminal"
+		if self.args.icons:
+			additionalFontNameSuffix += " S"
+			verboseAdditionalFontNameSuffix += " Subset " + splitext(
+			basename(self.args.icons))[0].replace("_", " ").replace("-", " ").title()
+
 		# add mono signifier to end of name
 		if self.args.single:
 			additionalFontNameSuffix += " M"
@@ -272,8 +757,10 @@ class FontPatcher:
 		self.sourceFont.appendSFNTName('English (US)', 'Compatible Full',
 		self.sourceFont.fullname)
 		self.sourceFont.appendSFNTName('English (US)', 'SubFamily', subFamily)
-		self.sourceFont.comment = projectInfo
-		self.sourceFont.fontlog = projectInfo
+		# drafts leave out the comment and fontlog tables
+		if self.args.buildProfile == 'release':
+			self.sourceFont.comment = projectInfo
+			self.sourceFont.fontlog = projectInfo
 
 		# TODO version not being set for all font types (e.g. ttf)
 		# print("Version was {}".format(sourceFont.version))
@@ -282,7 +769,7 @@ class FontPatcher:
 
 	def removeLigatures(self):
 		""" let's deal with ligatures (mostly for monospaced fonts) """
-		if self.args.configfile and self.config.read(self.args.configfile):
+		if self.session.configRead:
 			if self.args.removeligatures:
 				print("Removing ligatures from configfile `Subtables` section")
 				ligatureSubtables = json.loads(self.config.get("Subtables", "ligatures"))
@@ -298,222 +785,11 @@ class FontPatcher:
 			else:
 				print("No configfile given, skipping configfile related actions")
 
-	def checkPositionConflicts(self):
-		""" Prevent glyph encoding position conflicts between glyph sets """
-		if self.args.fontawesome and self.args.octicons:
-			self.octiconsExactEncodingPosition = False
-		if self.args.fontawesome or self.args.octicons:
-			self.fontlinuxExactEncodingPosition = False
-
 	def setupPatchSet(self):
 		""" Creates list of dicts to with instructions on copying glyphs from
-		each symbol font into self.sourceFont """
-		# Supported params: overlap | careful
-		# Powerline dividers
-		symAttrPowerline = {
-		'default': {'align': 'c', 'valign': 'c', 'stretch': 'pa', 'params': ''},
-
-		# Arrow tips
-		0xe0b0: {
-		'align': 'l', 'valign': 'c', 'stretch': 'xy',
-		'params': {'overlap': 0.02}}, 0xe0b1: {
-		'align': 'l', 'valign': 'c', 'stretch': 'xy',
-		'params': {'overlap': 0.02}}, 0xe0b2: {
-		'align': 'r', 'valign': 'c', 'stretch': 'xy',
-		'params': {'overlap': 0.02}}, 0xe0b3: {
-		'align': 'r', 'valign': 'c', 'stretch': 'xy', 'params': {'overlap': 0.02}},
-
-		# Rounded arcs
-		0xe0b4: {
-		'align': 'l', 'valign': 'c', 'stretch': 'xy',
-		'params': {'overlap': 0.01}}, 0xe0b5: {
-		'align': 'l', 'valign': 'c', 'stretch': 'xy',
-		'params': {'overlap': 0.01}}, 0xe0b6: {
-		'align': 'r', 'valign': 'c', 'stretch': 'xy', 'params': {'overlap': 0.01}},
-		0xe0b7: {
-		'align': 'r', 'valign': 'c', 'stretch': 'xy', 'params': {'overlap': 0.01}},
-
-		# Bottom Triangles
-		0xe0b8: {
-		'align': 'l', 'valign': 'c', 'stretch': 'xy',
-		'params': {'overlap': 0.02}}, 0xe0b9: {
-		'align': 'l', 'valign': 'c', 'stretch': 'xy',
-		'params': {'overlap': 0.02}}, 0xe0ba: {
-		'align': 'r', 'valign': 'c', 'stretch': 'xy',
-		'params': {'overlap': 0.02}}, 0xe0bb: {
-		'align': 'r', 'valign': 'c', 'stretch': 'xy', 'params': {'overlap': 0.02}},
-
-		# Top Triangles
-		0xe0bc: {
-		'align': 'l', 'valign': 'c', 'stretch': 'xy',
-		'params': {'overlap': 0.02}}, 0xe0bd: {
-		'align': 'l', 'valign': 'c', 'stretch': 'xy',
-		'params': {'overlap': 0.02}}, 0xe0be: {
-		'align': 'r', 'valign': 'c', 'stretch': 'xy',
-		'params': {'overlap': 0.02}}, 0xe0bf: {
-		'align': 'r', 'valign': 'c', 'stretch': 'xy', 'params': {'overlap': 0.02}},
-
-		# Flames
-		0xe0c0: {
-		'align': 'l', 'valign': 'c', 'stretch': 'xy',
-		'params': {'overlap': 0.01}}, 0xe0c1: {
-		'align': 'l', 'valign': 'c', 'stretch': 'xy',
-		'params': {'overlap': 0.01}}, 0xe0c2: {
-		'align': 'r', 'valign': 'c', 'stretch': 'xy',
-		'params': {'overlap': 0.01}}, 0xe0c3: {
-		'align': 'r', 'valign': 'c', 'stretch': 'xy', 'params': {'overlap': 0.01}},
-
-		# Small squares
-		0xe0c4: {'align': 'l', 'valign': 'c', 'stretch': 'xy', 'params': ''},
-		0xe0c5: {'align': 'r', 'valign': 'c', 'stretch': 'xy', 'params': ''},
-
-		# Bigger squares
-		0xe0c6: {'align': 'l', 'valign': 'c', 'stretch': 'xy', 'params': ''},
-		0xe0c7: {'align': 'r', 'valign': 'c', 'stretch': 'xy', 'params': ''},
-
-		# Waveform
-		0xe0c8: {
-		'align': 'l', 'valign': 'c', 'stretch': 'xy', 'params': {'overlap': 0.01}},
-
-		# Hexagons
-		0xe0cc: {'align': 'l', 'valign': 'c', 'stretch': 'xy', 'params': ''},
-		0xe0cd: {'align': 'l', 'valign': 'c', 'stretch': 'xy', 'params': ''},
-
-		# Legos
-		0xe0ce: {'align': 'l', 'valign': 'c', 'stretch': 'xy', 'params': ''},
-		0xe0cf: {'align': 'c', 'valign': 'c', 'stretch': 'xy',
-		'params': ''}, 0xe0d1: {
-		'align': 'l', 'valign': 'c', 'stretch': 'xy', 'params': {'overlap': 0.02}},
-
-		# Top and bottom trapezoid
-		0xe0d2: {
-		'align': 'l', 'valign': 'c', 'stretch': 'xy',
-		'params': {'overlap': 0.02}}, 0xe0d4: {
-		'align': 'r', 'valign': 'c', 'stretch': 'xy', 'params': {'overlap': 0.02}}}
-
-		symAttrDefault = {
-		# 'pa' == preserve aspect ratio
-		'default': {'align': 'c', 'valign': 'c', 'stretch': 'pa', 'params': ''}}
-
-		symAttrFontA = {
-		# 'pa' == preserve aspect ratio
-		'default': {'align': 'c', 'valign': 'c', 'stretch': 'pa', 'params': ''},
-
-		# Don't center these arrows vertically
-		0xf0dc: {'align': 'c', 'valign': '', 'stretch': 'pa', 'params': ''},
-		0xf0dd: {'align': 'c', 'valign': '', 'stretch': 'pa', 'params': ''},
-		0xf0de: {'align': 'c', 'valign': '', 'stretch': 'pa', 'params': ''}}
-
-		customAttr = {
-		# 'pa' == preserve aspect ratio
-		'default': {'align': 'c', 'valign': '', 'stretch': '', 'params': ''}}
-
-		# Most glyphs we want to maximize during the scale.  However, there are some
-		# that need to be small or stay relative in size to each other.
-		# The following list are those glyphs.  A tuple represents a range.
-		deviScaleList = {'ScaleGlyph': 0xE60E, 'GlyphsToScale': [(0xe6bd, 0xe6c3)]}
-		fontAScaleList = {
-		'ScaleGlyph': 0xF17A, 'GlyphsToScale': [
-		0xf005, 0xf006, (0xf026, 0xf028), 0xf02b, 0xf02c, (0xf031, 0xf035),
-		(0xf044, 0xf054), (0xf060, 0xf063), 0xf077, 0xf078, 0xf07d, 0xf07e, 0xf089,
-		(0xf0d7, 0xf0da), (0xf0dc, 0xf0de), (0xf100, 0xf107), 0xf141, 0xf142,
-		(0xf153, 0xf15a), (0xf175, 0xf178), 0xf182, 0xf183, (0xf221, 0xf22d),
-		(0xf255, 0xf25b)]}
-		octiScaleList = {
-		'ScaleGlyph': 0xF02E, 'GlyphsToScale': [(0xf03d, 0xf040), 0xf044,
-		(0xf051, 0xf053), 0xf05a, 0xf05b, 0xf071, 0xf078, (0xf09f, 0xf0aa), 0xf0ca]}
-
-		# Define the character ranges
-		# Symbol font ranges
-		# yapf: disable
-		self.patchSet = [
-		{'Enabled': True, 'Name': "Seti-UI + Custom",
-		'Filename': "original-source.otf", 'Exact': False, 'SymStart': 0xE4FA,
-		'SymEnd': 0xE52E, 'SrcStart': 0xE5FA, 'SrcEnd': 0xE62E, 'ScaleGlyph': None,
-		'Attributes': symAttrDefault},
-		{'Enabled': True, 'Name': "Devicons",
-		'Filename': "devicons.ttf",	'Exact': False, 'SymStart': 0xE600,
-		'SymEnd': 0xE6C5, 'SrcStart': 0xE700, 'SrcEnd': 0xE7C5, 'ScaleGlyph': deviScaleList,
-		'Attributes': symAttrDefault},
-		{'Enabled': self.args.powerline, 'Name': "Powerline Symbols",
-		'Filename': "PowerlineSymbols.otf", 'Exact': True, 'SymStart': 0xE0A0,
-		'SymEnd': 0xE0A2, 'SrcStart': None, 'SrcEnd': None, 'ScaleGlyph': None,
-		'Attributes': symAttrPowerline},
-		{'Enabled': self.args.powerline, 'Name': "Powerline Symbols",
-		'Filename': "PowerlineSymbols.otf", 'Exact': True, 'SymStart': 0xE0B0,
-		'SymEnd': 0xE0B3, 'SrcStart': None, 'SrcEnd': None, 'ScaleGlyph': None,
-		'Attributes': symAttrPowerline},
-		{'Enabled': self.args.powerlineextra, 'Name': "Powerline Extra Symbols",
-		'Filename': "PowerlineExtraSymbols.otf", 'Exact': True, 'SymStart': 0xE0A3,
-		'SymEnd': 0xE0A3, 'SrcStart': None, 'SrcEnd': None, 'ScaleGlyph': None,
-		'Attributes': symAttrPowerline},
-		{'Enabled': self.args.powerlineextra, 'Name': "Powerline Extra Symbols",
-		'Filename': "PowerlineExtraSymbols.otf", 'Exact': True, 'SymStart': 0xE0B4,
-		'SymEnd': 0xE0C8, 'SrcStart': None, 'SrcEnd': None, 'ScaleGlyph': None,
-		'Attributes': symAttrPowerline},
-		{'Enabled': self.args.powerlineextra, 'Name': "Powerline Extra Symbols",
-		'Filename': "PowerlineExtraSymbols.otf", 'Exact': True, 'SymStart': 0xE0CA,
-		'SymEnd': 0xE0CA, 'SrcStart': None, 'SrcEnd': None, 'ScaleGlyph': None,
-		'Attributes': symAttrPowerline},
-		{'Enabled': self.args.powerlineextra, 'Name': "Powerline Extra Symbols",
-		'Filename': "PowerlineExtraSymbols.otf", 'Exact': True, 'SymStart': 0xE0CC,
-		'SymEnd': 0xE0D4, 'SrcStart': None, 'SrcEnd': None, 'ScaleGlyph': None,
-		'Attributes': symAttrPowerline},
-		{'Enabled': self.args.pomicons, 'Name': "Pomicons",
-		'Filename': "Pomicons.otf", 'Exact': True, 'SymStart': 0xE000,
-		'SymEnd': 0xE00A, 'SrcStart': None, 'SrcEnd': None, 'ScaleGlyph': None,
-		'Attributes': symAttrDefault},
-		{'Enabled': self.args.fontawesome, 'Name': "Font Awesome",
-		'Filename': "FontAwesome.otf", 'Exact': True, 'SymStart': 0xF000,
-		'SymEnd': 0xF2E0, 'SrcStart': None, 'SrcEnd': None, 'ScaleGlyph': fontAScaleList,
-		'Attributes': symAttrFontA},
-		{'Enabled': self.args.fontawesomeextension, 'Name': "Font Awesome Extension",
-		'Filename': "font-awesome-extension.ttf", 'Exact': False, 'SymStart': 0xE000,
-		'SymEnd': 0xE0A9, 'SrcStart': 0xE200, 'SrcEnd': 0xE2A9, 'ScaleGlyph': None,
-		'Attributes': symAttrDefault}, # Maximize
-		{'Enabled': self.args.powersymbols, 'Name': "Power Symbols",
-		'Filename': "Unicode_IEC_symbol_font.otf", 'Exact': True, 'SymStart': 0x23FB,
-		'SymEnd': 0x23FE, 'SrcStart': None, 'SrcEnd': None, 'ScaleGlyph': None,
-		'Attributes': symAttrDefault}, # Power, Power On/Off, Power On, Sleep
-		{'Enabled': self.args.powersymbols, 'Name': "Power Symbols",
-		'Filename': "Unicode_IEC_symbol_font.otf", 'Exact': True, 'SymStart': 0x2B58,
-		'SymEnd': 0x2B58, 'SrcStart': None, 'SrcEnd': None, 'ScaleGlyph': None,
-		'Attributes': symAttrDefault}, # Heavy Circle (aka Power Off)
-		{'Enabled': self.args.material, 'Name': "Material",
-		'Filename': "materialdesignicons-webfont.ttf", 'Exact': False, 'SymStart': 0xF001,
-		'SymEnd': 0xF847, 'SrcStart': 0xF500, 'SrcEnd': 0xFD46, 'ScaleGlyph': None,
-		'Attributes': symAttrDefault},
-		{'Enabled': self.args.weather, 'Name': "Weather Icons",
-		'Filename': "weathericons-regular-webfont.ttf", 'Exact': False,
-		'SymStart': 0xF000, 'SymEnd': 0xF0EB, 'SrcStart': 0xE300, 'SrcEnd': 0xE3EB, 'ScaleGlyph': None,
-		'Attributes': symAttrDefault},
-		{'Enabled': self.args.fontlinux, 'Name': "Font Logos (Font Linux)",
-		'Filename': "font-logos.ttf", 'Exact': self.fontlinuxExactEncodingPosition,
-		'SymStart': 0xF100, 'SymEnd': 0xF11C, 'SrcStart': 0xF300, 'SrcEnd': 0xF31C, 'ScaleGlyph': None,
-		'Attributes': symAttrDefault},
-		{'Enabled': self.args.octicons, 'Name': "Octicons",
-		'Filename': "octicons.ttf", 'Exact': self.octiconsExactEncodingPosition,
-		'SymStart': 0xF000, 'SymEnd': 0xF105, 'SrcStart': 0xF400, 'SrcEnd': 0xF505,
-		'ScaleGlyph': octiScaleList, 'Attributes': symAttrDefault}, # Magnifying glass
-		{'Enabled': self.args.octicons, 'Name': "Octicons",
-		'Filename': "octicons.ttf", 'Exact': self.octiconsExactEncodingPosition,
-		'SymStart': 0x2665, 'SymEnd': 0x2665, 'SrcStart': None, 'SrcEnd': None,
-		'ScaleGlyph': octiScaleList, 'Attributes': symAttrDefault}, # Heart
-		{'Enabled': self.args.octicons, 'Name': "Octicons",
-		'Filename': "octicons.ttf", 'Exact': self.octiconsExactEncodingPosition,
-		'SymStart': 0X26A1, 'SymEnd': 0X26A1, 'SrcStart': None, 'SrcEnd': None,
-		'ScaleGlyph': octiScaleList, 'Attributes': symAttrDefault}, # Zap
-		{'Enabled': self.args.octicons, 'Name': "Octicons",
-		'Filename': "octicons.ttf", 'Exact': self.octiconsExactEncodingPosition,
-		#'SymStart': 0xF27C, 'SymEnd': 0xF27C, 'SrcStart': 0xF4A9, 'SrcEnd': 0xF4A9,
-		'SymStart': 0xF27C, 'SymEnd': 0xF2BD, 'SrcStart': 0xF4A9, 'SrcEnd': 0xF4EA,
-		'ScaleGlyph': octiScaleList, 'Attributes': symAttrDefault}, # Desktop
-		{'Enabled': self.args.custom, 'Name': "Custom",
-		'Filename': self.args.custom, 'Exact': True,
-		'SymStart': 0x0000, 'SymEnd': 0x0000, 'SrcStart': 0x0000, 'SrcEnd': 0x0000,
-		'ScaleGlyph': None, 'Attributes': customAttr}]
-
-		# yapf: enable
+		each symbol font into self.sourceFont, shared by the session """
+		self.patchSet = self.session.patchSet
+		self.patchTables = self.session.getPatchTables()
 
 	def setupLineDimensions(self):
 		"""
@@ -547,15 +823,13 @@ class FontPatcher:
 		# Ignore the y-values, os2_winXXXXX values set above are used for line height
 		#
 		# 0x00-0x17f is the Latin Extended-A range
-		for glyph in range(0x00, 0x17f):
-			try:
-				(_, _, xmax, _) = self.sourceFont[glyph].boundingBox()
-			except TypeError:
+		for index, unicode in enumerate(self.metrics.unicodes):
+			if unicode < 0x00 or unicode >= 0x17f:
 				continue
-			if self.fontDim['width'] < self.sourceFont[glyph].width:
-				self.fontDim['width'] = self.sourceFont[glyph].width
-			if xmax > self.fontDim['xmax']:
-				self.fontDim['xmax'] = xmax
+			if self.fontDim['width'] < self.metrics.widths[index]:
+				self.fontDim['width'] = self.metrics.widths[index]
+			if self.metrics.bboxes[4 * index + 2] > self.fontDim['xmax']:
+				self.fontDim['xmax'] = self.metrics.bboxes[4 * index + 2]
 
 		# Calculate font height
 		self.fontDim['height'] = abs(self.fontDim['ymin']) + self.fontDim['ymax']
@@ -575,22 +849,310 @@ class FontPatcher:
 			scaleRatio = scaleRatioX
 		return scaleRatio
 
-	def copyGlyphs(self, sourceFontStart, sourceFontEnd, symbolFont,
-	symbolFontStart, symbolFontEnd, exactEncoding, scaleGlyph, setName,
-	attributes):
-		""" Copies symbol glyphs into self.sourceFont """
-		progressText = ''
-		careful = False
-		glyphSetLength = 0
+	def getAlignDistance(self, symDim, symAttr):
+		""" Returns the x and y distances that align a glyph with dimensions
+		symDim according to symAttr """
+		yAlignDistance = 0
+		if symAttr['valign'] == 'c':
+			# Center the symbol vertically by matching the center of the line height and center of symbol
+			symYCenter = symDim['ymax'] - (symDim['height'] / 2)
+			fontYCenter = self.fontDim['ymax'] - (self.fontDim['height'] / 2)
+			yAlignDistance = fontYCenter - symYCenter
+
+		# Handle glyph l/r/c alignment
+		xAlignDistance = 0
+		if symAttr['align']:
+			# First find the baseline x-alignment (left alignment amount)
+			xAlignDistance = self.fontDim['xmin'] - symDim['xmin']
+			if symAttr['align'] == 'c':
+				# Center align
+				xAlignDistance += (self.fontDim['width'] / 2) - (symDim['width'] / 2)
+			elif symAttr['align'] == 'r':
+				# Right align
+				xAlignDistance += self.fontDim['width'] - symDim['width']
+
+		if 'overlap' in symAttr['params']:
+			overlapWidth = self.fontDim['width'] * symAttr['params']['overlap']
+			if symAttr['align'] == 'l':
+				xAlignDistance -= overlapWidth
+			if symAttr['align'] == 'r':
+				xAlignDistance += overlapWidth
+		return xAlignDistance, yAlignDistance
+
+	def getScaleRatios(self, symDim, symAttr, unicode, patchTable, scaleFactor):
+		""" Returns the x and y scale ratios of a symbol glyph with dimensions
+		symDim, scaleFactor being that of the entry's ScaleGlyph (or 0) """
+		scaleRatioX = 1
+		scaleRatioY = 1
+
+		# If we are creating a monospace font we need to scale and move the
+		# glyphs.  It is possible to have empty glyphs, so we need to skip those.
+		if self.args.single and symDim['width'] and symDim['height']:
+			# If we want to preserve that aspect ratio of the glyphs we need to
+			# find the largest possible scaling factor that will allow the glyph
+			# to fit in both the x and y directions
+			if symAttr['stretch'] == 'pa':
+				if scaleFactor and useScaleGlyph(unicode, patchTable.scaleStarts,
+				patchTable.scaleEnds):
+					# We want to preserve the relative size of each glyph to other glyphs
+					# in the same symbol font.
+					scaleRatioX = scaleFactor
+					scaleRatioY = scaleFactor
+				else:
+					# In this case, each glyph is sized independently to each other
+					scaleRatioX = self.getScaleFactor(symDim)
+					scaleRatioY = scaleRatioX
+			else:
+				if 'x' in symAttr['stretch']:
+					# Stretch the glyph horizontally to fit the entire available width
+					scaleRatioX = self.fontDim['width'] / symDim['width']
+		# end if single width
+
+		# non-monospace (double width glyphs)
+		# elif sym_dim['width'] and sym_dim['height']:
+		# any special logic we want to apply for double-width variation
+		# would go here
+
+		if 'y' in symAttr['stretch']:
+			# Stretch the glyph vertically to total line height (good for powerline separators)
+			# Currently stretching vertically for both monospace and double-width
+			scaleRatioY = self.fontDim['height'] / symDim['height']
+		return scaleRatioX, scaleRatioY
+
+	def getGlyphMatricesVectorized(self, symbolGlyphs, patchTable, scaleFactor):
+		""" Returns the matrix of each of symbolGlyphs, computed with numpy for
+		all of them at once from an array of their bounding boxes. Follows
+		getScaleRatios and getGlyphMatrix operation by operation, so the numbers
+		are the same as theirs """
+		if not symbolGlyphs:
+			return []
+		bboxes = numpy.array([symGlyph.boundingBox() for symGlyph in symbolGlyphs],
+		dtype=float)
+		unicodes = numpy.array([symGlyph.unicode for symGlyph in symbolGlyphs])
+		attributeIds = numpy.array([
+		patchTable.attributeIds.get(symGlyph.unicode, 0) for symGlyph in symbolGlyphs])
+		fontDim = self.fontDim
+
+		def perGlyph(attributeValues):
+			""" Spreads one value per attribute set over the glyphs using it """
+			return numpy.array(attributeValues)[attributeIds]
+
+		attributes = patchTable.attributes
+		stretchPa = perGlyph([symAttr['stretch'] == 'pa' for symAttr in attributes])
+		stretchX = perGlyph(['x' in symAttr['stretch'] for symAttr in attributes])
+		stretchY = perGlyph(['y' in symAttr['stretch'] for symAttr in attributes])
+		aligned = perGlyph([bool(symAttr['align']) for symAttr in attributes])
+		alignC = perGlyph([symAttr['align'] == 'c' for symAttr in attributes])
+		alignR = perGlyph([symAttr['align'] == 'r' for symAttr in attributes])
+		alignL = perGlyph([symAttr['align'] == 'l' for symAttr in attributes])
+		valignC = perGlyph([symAttr['valign'] == 'c' for symAttr in attributes])
+		overlapped = perGlyph(['overlap' in symAttr['params'] for symAttr in attributes])
+		overlap = perGlyph([
+		symAttr['params']['overlap'] if 'overlap' in symAttr['params'] else 0
+		for symAttr in attributes])
+
+		# see getGlyphDimensions
+		xmin, ymin, xmax, ymax = bboxes.T
+		width = xmax + (-xmin)
+		height = ymax + (-ymin)
+
+		# see getScaleRatios
+		scaleRatioX = numpy.ones(len(symbolGlyphs))
+		scaleRatioY = numpy.ones(len(symbolGlyphs))
+		with numpy.errstate(divide='ignore', invalid='ignore'):
+			if self.args.single:
+				sized = (width != 0) & (height != 0)
+				fitX = fontDim['width'] / width
+				fitY = self.sourceFont.em / height
+				fit = numpy.where(fitX > fitY, fitY, fitX)
+				if scaleFactor and len(patchTable.scaleStarts):
+					# see useScaleGlyph
+					scaleEnds = numpy.array(patchTable.scaleEnds, dtype=int)
+					index = numpy.searchsorted(numpy.array(patchTable.scaleStarts, dtype=int),
+					unicodes, side='right') - 1
+					inGroup = (index >= 0) & (unicodes <= scaleEnds[index.clip(0)])
+					fit = numpy.where(inGroup, scaleFactor, fit)
+				scaleRatioX = numpy.where(sized & stretchPa, fit,
+				numpy.where(sized & ~stretchPa & stretchX, fitX, scaleRatioX))
+				scaleRatioY = numpy.where(sized & stretchPa, fit, scaleRatioY)
+			if numpy.any(stretchY & (height == 0)):
+				raise ZeroDivisionError("float division by zero")
+			scaleRatioY = numpy.where(stretchY, fontDim['height'] / height, scaleRatioY)
+
+		# see getGlyphMatrix
+		grown = overlapped & ((scaleRatioX != 1) | (scaleRatioY != 1))
+		scaleRatioX = numpy.where(grown, scaleRatioX * (1 + overlap), scaleRatioX)
+		scaleRatioY = numpy.where(grown, scaleRatioY * (1 + overlap), scaleRatioY)
+		scaledXmin = xmin * scaleRatioX
+		scaledYmax = ymax * scaleRatioY
+		scaledWidth = width * scaleRatioX
+		scaledHeight = height * scaleRatioY
+
+		# see getAlignDistance
+		yAlignDistance = numpy.where(valignC,
+		(fontDim['ymax'] - (fontDim['height'] / 2)) - (scaledYmax - (scaledHeight / 2)),
+		0.0)
+		xAlignDistance = numpy.where(aligned, fontDim['xmin'] - scaledXmin, 0.0)
+		xAlignDistance = numpy.where(alignC,
+		xAlignDistance + ((fontDim['width'] / 2) - (scaledWidth / 2)), xAlignDistance)
+		xAlignDistance = numpy.where(alignR,
+		xAlignDistance + (fontDim['width'] - scaledWidth), xAlignDistance)
+		overlapWidth = fontDim['width'] * overlap
+		xAlignDistance = numpy.where(overlapped & alignL, xAlignDistance - overlapWidth,
+		xAlignDistance)
+		xAlignDistance = numpy.where(overlapped & alignR, xAlignDistance + overlapWidth,
+		xAlignDistance)
+		xAlignDistance = numpy.where(scaledXmin + xAlignDistance < 0.0, -scaledXmin,
+		xAlignDistance)
+
+		# psMat.compose(psMat.scale(x, y), psMat.translate(dx, dy)), whose sums
+		# turn a translation of -0.0 into 0.0
+		zeros = numpy.zeros(len(symbolGlyphs))
+		return numpy.stack([
+		scaleRatioX, zeros, zeros, scaleRatioY, 0.0 + xAlignDistance,
+		0.0 + yAlignDistance], axis=1).tolist()
+
+	def getGlyphMatrix(self, symDim, symAttr, scaleRatioX, scaleRatioY):
+		""" Returns one matrix that scales, aligns and removes the negative left
+		bearing of a glyph with dimensions symDim. The scaled bounding box is
+		derived from symDim instead of being measured after a first transform """
+		if scaleRatioX != 1 or scaleRatioY != 1:
+			if 'overlap' in symAttr['params']:
+				scaleRatioX *= 1 + symAttr['params']['overlap']
+				scaleRatioY *= 1 + symAttr['params']['overlap']
+
+		# Scale ratios are positive so the scaled bounding box is the scaled symDim
+		scaledDim = {
+		'xmin': symDim['xmin'] * scaleRatioX, 'ymin': symDim['ymin'] * scaleRatioY,
+		'xmax': symDim['xmax'] * scaleRatioX, 'ymax': symDim['ymax'] * scaleRatioY,
+		'width': symDim['width'] * scaleRatioX,
+		'height': symDim['height'] * scaleRatioY}
+		xAlignDistance, yAlignDistance = self.getAlignDistance(scaledDim, symAttr)
+
+		# Ensure after horizontal adjustments and centering that the glyph does not
+		# overlap the left bearing (edge). The right bearing only changes the width,
+		# which setGlyphWidthMono overwrites
+		if scaledDim['xmin'] + xAlignDistance < 0.0:
+			xAlignDistance = -scaledDim['xmin']
+		return psMat.compose(psMat.scale(scaleRatioX, scaleRatioY),
+		psMat.translate(xAlignDistance, yAlignDistance))
+
+	def checkGlyphMatrix(self, layer, symAttr, scaleRatioX, scaleRatioY,
+	glyphMatrix):
+		""" Returns True if glyphMatrix places the outline in layer where the step by
+		step pipeline (scale, measure, align, remove negative bearings) would """
+		expected = layer.dup()
+		if scaleRatioX != 1 or scaleRatioY != 1:
+			if 'overlap' in symAttr['params']:
+				scaleRatioX *= 1 + symAttr['params']['overlap']
+				scaleRatioY *= 1 + symAttr['params']['overlap']
+			expected.transform(psMat.scale(scaleRatioX, scaleRatioY))
+		expected.transform(psMat.translate(*self.getAlignDistance(
+		getGlyphDimensions(expected), symAttr)))
+		leftBearing = expected.boundingBox()[0]
+		if leftBearing < 0.0:
+			expected.transform(psMat.translate(-leftBearing, 0))
+		layer.transform(glyphMatrix)
+		return all(
+		abs(actual - wanted) <= 0.5
+		for actual, wanted in zip(layer.boundingBox(), expected.boundingBox()))
+
+	def planPatch(self):
+		""" Resolves every enabled patch set entry into a flat list of glyph
+		operations, recording the slots that are skipped or written twice """
+		plan = {
+		'version': VERSION, 'em': self.sourceFont.em, 'fontDim': self.fontDim,
+		'single': self.args.single, 'careful': self.args.careful,
+		'icons': self.session.iconsHash, 'sets': []}
+		plannedSlots = CodepointBitset() # slots written by the operations planned so far
+		for patch, patchTable in zip(self.patchSet, self.patchTables):
+			if patch['Enabled']:
+				with self.profiler.span("plan " + patch['Name'], hot=True) as span:
+					planSet = self.planGlyphs(patch, patchTable, plannedSlots)
+					span['glyphs'] = len(planSet['operations'])
+					span['skipped'] = len(planSet['skipped'])
+				plan['sets'].append(planSet)
+		if self.session.icons:
+			self.checkIconsFound(plan)
+		return plan
+
+	def checkIconsFound(self, plan):
+		""" Warns about the entries of the --icons file that match no glyph of
+		the enabled patch sets """
+		codepoints = set()
+		names = set()
+		for planSet in plan['sets']:
+			codepoints.update(
+			operation['target'] for operation in planSet['skipped'])
+			for operation in planSet['operations']:
+				codepoints.add(operation['target'])
+				names.add(operation['name'])
+		missing = ["U+{:04X}".format(codepoint)
+		for codepoint in sorted(self.session.icons.codepoints - codepoints)]
+		missing += sorted(self.session.icons.names - names)
+		if missing:
+			sys.stderr.write("{}: {} icons of {} are not in the enabled glyph sets: "
+			"{}\n".format(PROJECT_NAME, len(missing), self.args.icons, " ".join(missing)))
+
+	def planGlyphs(self, patch, patchTable, plannedSlots):
+		""" Plans the operations copying the glyphs of one patch set entry into
+		self.sourceFont. On a glyph cache hit the symbol font is not opened """
+		planSet = {
+		'name': patch['Name'], 'filename': patch['Filename'], 'cacheKey': None,
+		'operations': [], 'skipped': [], 'conflicts': []}
+		operations = None
+		if self.glyphCache:
+			planSet['cacheKey'] = self.getGlyphCacheKey(patch)
+			cachedGlyphs = self.glyphCache.get(planSet['cacheKey'])
+			if cachedGlyphs is not None:
+				self.cachedGlyphs[planSet['cacheKey']] = {
+				cachedGlyph['target']: cachedGlyph for cachedGlyph in cachedGlyphs}
+				operations = [{
+				key: cachedGlyph[key]
+				for key in ('symbol', 'target', 'name', 'matrix', 'width', 'careful')}
+				for cachedGlyph in cachedGlyphs]
+		if operations is None:
+			operations = self.getGlyphOperations(patch, patchTable)
+		self.selectOperations(planSet, operations, plannedSlots)
+		return planSet
+
+	def selectOperations(self, planSet, operations, plannedSlots):
+		""" Adds operations to the operations, skipped and conflicts of planSet.
+		A skipped operation is kept whole with the position in the operations it
+		was skipped at, so a plan applied to another font can still copy it """
+		for operation in operations:
+			# check if a glyph already exists in this location, either in the
+			# source font or copied there by an earlier set
+			if self.args.careful or operation['careful']:
+				if self.metrics.hasCodepoint(operation['target']) or operation[
+				'target'] in plannedSlots:
+					if self.args.quiet is False:
+						print("  Found existing Glyph at {:X}. Skipping...".format(
+						operation['target']))
 
-		if self.args.careful:
-			careful = True
+					# We don't want to touch anything so move to next Glyph
+					planSet['skipped'].append(dict(operation,
+					position=len(planSet['operations'])))
+					continue
+			if operation['target'] in plannedSlots:
+				planSet['conflicts'].append(operation['target'])
+			plannedSlots.add(operation['target'])
+			planSet['operations'].append(operation)
+
+	def getGlyphOperations(self, patch, patchTable):
+		""" Returns the operations that copy the glyphs of one patch set entry
+		from its symbol font, with the matrix placing each glyph """
+		# The session keeps symbol fonts open across entries and fonts
+		symbolFont = self.session.getSymbolFont(patch['Filename'],
+		self.sourceFont.em)
+		symbolFontStart = patch['SymStart']
+		symbolFontEnd = patch['SymEnd']
+		scaleGlyph = patch['ScaleGlyph']
 
-		if exactEncoding is False:
-			sourceFontList = []
-			sourceFontCounter = 0
-			for i in range(sourceFontStart, sourceFontEnd + 1):
-				sourceFontList.append(format(i, 'X'))
+		careful = False
+		operations = []
+		transformMismatches = 0
+		icons = self.session.icons
 
 		scaleFactor = 0
 		if scaleGlyph:
@@ -602,212 +1164,1220 @@ class FontPatcher:
 		# If we are going to copy all Glyphs, then assume we want to be careful
 		# and only copy those that are not already contained in the source font
 		if symbolFontStart == 0:
-			symbolFont.selection.all()
-			self.sourceFont.selection.all()
 			careful = True
-		else:
-			symbolFont.selection.select((str("ranges"), str("unicode")),
-			symbolFontStart, symbolFontEnd)
-			self.sourceFont.selection.select((str("ranges"), str("unicode")),
-			sourceFontStart, sourceFontEnd)
-
-		# Get number of selected non-empty glyphs @TODO FIXME
-		for index, symGlyph in enumerate(symbolFont.selection.byGlyphs):
-			glyphSetLength += 1
-		# end for
-
-		if self.args.quiet is False:
-			sys.stdout.write("Adding " + str(max(1, glyphSetLength)) + " Glyphs from " +
-			setName + " Set \n")
 
-		for index, symGlyph in enumerate(symbolFont.selection.byGlyphs):
-			index = max(1, index)
+		# The selection is only walked once, glyphs are transferred directly later
+		# so neither font's selection nor the clipboard is touched
+		symbolGlyphs = selectSymbolGlyphs(symbolFont, symbolFontStart, symbolFontEnd)
 
-			try:
-				symAttr = attributes[symGlyph.unicode]
-			except KeyError:
-				symAttr = attributes['default']
-
-			if exactEncoding:
-				# use the exact same hex values for the source font as for the symbol font
-				currentSourceFontGlyph = symGlyph.encoding
-
-				# Save as a hex string without the '0x' prefix
-				copiedToSlot = format(symGlyph.unicode, 'X')
+		selected = [] # (symbol glyph, target slot) of each glyph to copy
+		for symGlyph in symbolGlyphs:
+			if patchTable.targets is None:
+				# use the exact same encoding for the source font as for the symbol font
+				if symGlyph.unicode < 0:
+					currentSourceFontGlyph = None
+				else:
+					currentSourceFontGlyph = symGlyph.encoding
 			else:
-				# use source font defined hex values based on passed in start and end
-				# convince that this string really is a hex:
-				currentSourceFontGlyph = int("0x" + sourceFontList[sourceFontCounter], 16)
-				copiedToSlot = sourceFontList[sourceFontCounter]
-				sourceFontCounter += 1
+				currentSourceFontGlyph = patchTable.targets.get(symGlyph.unicode)
 
-			if int(copiedToSlot, 16) < 0:
+			if currentSourceFontGlyph is None:
 				print("Found invalid glyph slot number. Skipping.")
 				continue
 
-			if self.args.quiet is False:
-				updateProgress(round(float(index + 1) / glyphSetLength, 2))
-
-			# Prepare symbol glyph dimensions
-			symDim = getGlyphDimensions(symGlyph)
-
-			# check if a glyph already exists in this location
-			if careful or 'careful' in symAttr['params']:
-				if copiedToSlot.startswith("uni"):
-					copiedToSlot = copiedToSlot[3:]
-				codepoint = int("0x" + copiedToSlot, 16)
-				if codepoint in self.sourceFont:
-					if self.args.quiet is False:
-						print("  Found existing Glyph at {}. Skipping...".format(copiedToSlot))
-
-					# We don't want to touch anything so move to next Glyph
-					continue
-
-			# Select and copy symbol from its encoding point
-			# We need to do this select after the careful check, this way we don't
-			# reset our selection before starting the next loop
-			symbolFont.selection.select(symGlyph.encoding)
-			symbolFont.copy()
-
-			# Paste it
-			self.sourceFont.selection.select(currentSourceFontGlyph)
-			self.sourceFont.paste()
-			self.sourceFont[currentSourceFontGlyph].glyphname = symGlyph.glyphname
-			scaleRatioX = 1
-			scaleRatioY = 1
-
-			# Now that we have copy/pasted the glyph, if we are creating a monospace
-			# font we need to scale and move the glyphs.  It is possible to have
-			# empty glyphs, so we need to skip those.
-			if self.args.single and symDim['width'] and symDim['height']:
-				# If we want to preserve that aspect ratio of the glyphs we need to
-				# find the largest possible scaling factor that will allow the glyph
-				# to fit in both the x and y directions
-				if symAttr['stretch'] == 'pa':
-					if scaleFactor and useScaleGlyph(symGlyph.unicode,
-					scaleGlyph['GlyphsToScale']):
-						# We want to preserve the relative size of each glyph to other glyphs
-						# in the same symbol font.
-						scaleRatioX = scaleFactor
-						scaleRatioY = scaleFactor
-					else:
-						# In this case, each glyph is sized independently to each other
-						scaleRatioX = self.getScaleFactor(symDim)
-						scaleRatioY = scaleRatioX
-				else:
-					if 'x' in symAttr['stretch']:
-						# Stretch the glyph horizontally to fit the entire available width
-						scaleRatioX = self.fontDim['width'] / symDim['width']
-			# end if single width
-
-			# non-monospace (double width glyphs)
-			# elif sym_dim['width'] and sym_dim['height']:
-			# any special logic we want to apply for double-width variation
-			# would go here
-
-			if 'y' in symAttr['stretch']:
-				# Stretch the glyph vertically to total line height (good for powerline separators)
-				# Currently stretching vertically for both monospace and double-width
-				scaleRatioY = self.fontDim['height'] / symDim['height']
-
-			if scaleRatioX != 1 or scaleRatioY != 1:
-				if 'overlap' in symAttr['params']:
-					scaleRatioX *= 1 + symAttr['params']['overlap']
-					scaleRatioY *= 1 + symAttr['params']['overlap']
-				self.sourceFont.transform(psMat.scale(scaleRatioX, scaleRatioY))
-
-			# Use the dimensions from the newly pasted and stretched glyph
-			symDim = getGlyphDimensions(self.sourceFont[currentSourceFontGlyph])
-			yAlignDistance = 0
-			if symAttr['valign'] == 'c':
-				# Center the symbol vertically by matching the center of the line height and center of symbol
-				symYCenter = symDim['ymax'] - (symDim['height'] / 2)
-				fontYCenter = self.fontDim['ymax'] - (self.fontDim['height'] / 2)
-				yAlignDistance = fontYCenter - symYCenter
-
-			# Handle glyph l/r/c alignment
-			xAlignDistance = 0
-			if symAttr['align']:
-				# First find the baseline x-alignment (left alignment amount)
-				xAlignDistance = self.fontDim['xmin'] - symDim['xmin']
-				if symAttr['align'] == 'c':
-					# Center align
-					xAlignDistance += (self.fontDim['width'] / 2) - (symDim['width'] / 2)
-				elif symAttr['align'] == 'r':
-					# Right align
-					xAlignDistance += self.fontDim['width'] - symDim['width']
-
-			if 'overlap' in symAttr['params']:
-				overlapWidth = self.fontDim['width'] * symAttr['params']['overlap']
-				if symAttr['align'] == 'l':
-					xAlignDistance -= overlapWidth
-				if symAttr['align'] == 'r':
-					xAlignDistance += overlapWidth
-
-			alignMatrix = psMat.translate(xAlignDistance, yAlignDistance)
-			self.sourceFont.transform(alignMatrix)
-
-			# Ensure after horizontal adjustments and centering that the glyph
-			# does not overlap the bearings (edges)
-			self.removeGlyphNegBearings(self.sourceFont[currentSourceFontGlyph])
-
-			# Needed for setting 'advance width' on each glyph so they do not overlap,
-			# also ensures the font is considered monospaced on Windows by setting the
-			# same width for all character glyphs. This needs to be done for all glyphs,
-			# even the ones that are empty and didn't go through the scaling operations.
-			# it should come after setting the glyph bearings
-			self.setGlyphWidthMono(self.sourceFont[currentSourceFontGlyph])
-
-			# reset selection so iteration works properly @TODO fix? rookie misunderstanding?
-			# This is likely needed because the selection was changed when the glyph was copy/pasted
-			if symbolFontStart == 0:
-				symbolFont.selection.all()
+			# Glyphs left out of an --icons subset are not measured at all. The
+			# scale factor above still comes from the whole symbol font, so the
+			# kept glyphs have the same size as in a full build
+			if icons and not (currentSourceFontGlyph in icons.codepoints or
+			symGlyph.glyphname in icons.names):
+				continue
+			selected.append((symGlyph, currentSourceFontGlyph))
+
+		glyphMatrices = None
+		if self.args.mathBackend == 'numpy':
+			glyphMatrices = self.getGlyphMatricesVectorized(
+			[symGlyph for symGlyph, _ in selected], patchTable, scaleFactor)
+
+		for index, (symGlyph, currentSourceFontGlyph) in enumerate(selected):
+			symAttr = patchTable.attributes[patchTable.attributeIds.get(
+			symGlyph.unicode, 0)]
+
+			if glyphMatrices is None or self.args.checkTransforms:
+				# Prepare symbol glyph dimensions
+				symDim = getGlyphDimensions(symGlyph)
+				scaleRatioX, scaleRatioY = self.getScaleRatios(symDim, symAttr,
+				symGlyph.unicode, patchTable, scaleFactor)
+
+			# Scale, alignment and bearing correction are applied as one matrix
+			if glyphMatrices is None:
+				glyphMatrix = self.getGlyphMatrix(symDim, symAttr, scaleRatioX,
+				scaleRatioY)
 			else:
-				symbolFont.selection.select((str("ranges"), str("unicode")),
-				symbolFontStart, symbolFontEnd)
+				glyphMatrix = glyphMatrices[index]
+			if self.args.checkTransforms and not self.checkGlyphMatrix(
+			getGlyphOutline(symGlyph), symAttr, scaleRatioX, scaleRatioY, glyphMatrix):
+				transformMismatches += 1
+				print("  Transform of Glyph {:X} differs from the step by step result".format(
+				currentSourceFontGlyph))
+
+			# Every copied glyph gets the same advance width so they do not overlap,
+			# this also ensures the font is considered monospaced on Windows. This is
+			# needed for all glyphs, even the empty ones that are not scaled.
+			operations.append({
+			'symbol': symGlyph.encoding, 'target': currentSourceFontGlyph,
+			'name': symGlyph.glyphname, 'matrix': list(glyphMatrix),
+			'width': self.fontDim['width'],
+			'careful': careful or 'careful' in symAttr['params']})
 		# end for
 
-		if self.args.quiet is False or self.args.progressbars:
-			sys.stdout.write("\n")
+		if self.args.checkTransforms:
+			print("Checked {} Glyph transforms of {} Set, {} differ".format(
+			len(operations), patch['Name'], transformMismatches))
+		return operations
+
+	def applyPlan(self, plan):
+		""" Executes the glyph operations of a plan on self.sourceFont """
+		for planSet in plan['sets']:
+			with self.profiler.span("apply " + planSet['name'], hot=True) as span:
+				self.applyGlyphs(planSet)
+				span['glyphs'] = len(planSet['operations'])
+				span['skipped'] = len(planSet['skipped'])
+
+	def applyGlyphs(self, planSet):
+		""" Copies the glyphs of one planned set into self.sourceFont, from the
+		glyph cache when it holds them and from the symbol font otherwise """
+		operations = planSet['operations']
+		cacheKey = planSet['cacheKey'] if self.glyphCache else None
+		cachedGlyphs = None
+		if cacheKey:
+			cachedGlyphs = self.cachedGlyphs.get(cacheKey)
+			if cachedGlyphs is None:
+				cachedList = self.glyphCache.get(cacheKey)
+				if cachedList is not None:
+					cachedGlyphs = {
+					cachedGlyph['target']: cachedGlyph for cachedGlyph in cachedList}
+		symbolFont = None
+
+		self.progress.startSet(planSet['name'], len(operations), bool(cachedGlyphs))
+		for index, operation in enumerate(operations):
+			self.progress.update(index + 1)
+			targetGlyph = self.sourceFont.createChar(operation['target'])
+			if cachedGlyphs and operation['target'] in cachedGlyphs:
+				insertCachedGlyph(cachedGlyphs[operation['target']], targetGlyph)
+			else:
+				if symbolFont is None:
+					symbolFont = self.session.getSymbolFont(planSet['filename'],
+					self.sourceFont.em)
+				if isinstance(symbolFont, StoredSymbolFont):
+					symbolFont.placeGlyph(operation['symbol'], targetGlyph,
+					operation['matrix'])
+				else:
+					transferGlyph(symbolFont[operation['symbol']], targetGlyph)
+					targetGlyph.transform(tuple(operation['matrix']))
+			targetGlyph.glyphname = operation['name']
+			targetGlyph.width = operation['width']
+		self.progress.finishSet(len(planSet['skipped']))
+
+		# Only cache complete sets, glyphs skipped because the source font
+		# already has them may be needed by the next font
+		if cacheKey and cachedGlyphs is None and not planSet['skipped']:
+			self.glyphCache.put(cacheKey, [
+			serializeGlyph(self.sourceFont[operation['target']], operation)
+			for operation in operations])
+
+	def dedupGlyphs(self, plan):
+		""" Replaces every patched glyph whose outline and width repeat those of
+		an earlier patched glyph with a reference to that glyph. Returns the
+		number of glyphs replaced and an estimate of the bytes saved in a
+		TrueType glyf table, 0 without TrueType outputs (CFF outlines get the
+		references unlinked) """
+		originals = {} # outline hash: first patched glyph with that outline
+		glyphsSaved = 0
+		bytesSaved = 0
+		trueType = any(extension.lower() in ('.ttf', '.woff', '.woff2')
+		for extension in self.extensions)
+		# The final glyph of each slot, in the order the plan patched them
+		targets = dict.fromkeys(
+		operation['target']
+		for planSet in plan['sets'] for operation in planSet['operations'])
+		for target in targets:
+			glyph = self.sourceFont[target]
+			contours = [[
+			contour.closed, contour.is_quadratic,
+			[[round(point.x, 3), round(point.y, 3), point.on_curve] for point in contour]]
+			for contour in glyph.foreground]
+			if not contours:
+				continue
+			outlineHash = sha256(json.dumps([glyph.width, contours]).encode(
+			"utf-8")).digest()
+			original = originals.setdefault(outlineHash, glyph)
+			# References are by name, which must lead back to the original
+			if original is glyph or original.glyphname not in self.sourceFont or (
+			self.sourceFont[original.glyphname].encoding != original.encoding):
+				continue
+			width = glyph.width
+			glyph.clear()
+			glyph.addReference(original.glyphname)
+			glyph.width = width
+			glyphsSaved += 1
+			if trueType:
+				# A simple glyph takes a header, the contour ends and about 5 bytes a
+				# point, a composite glyph with one component 18 bytes
+				points = sum(len(contour[2]) for contour in contours)
+				bytesSaved += 12 + 2 * len(contours) + 5 * points - 18
+		return glyphsSaved, bytesSaved
+
+	def checkPlan(self, plan):
+		""" Raises ValueError if plan was made for different metrics or sets """
+		planSets = [(planSet['name'], planSet['filename']) for planSet in plan['sets']]
+		enabledSets = [(patch['Name'], patch['Filename'])
+		for patch in self.patchSet if patch['Enabled']]
+		planDim = {key: plan['fontDim'].get(key) for key in PLACEMENT_DIMENSIONS}
+		if (plan['version'], plan['em'], planDim, plan['single'],
+		plan['careful'], plan.get('icons'), planSets) != (VERSION,
+		self.sourceFont.em, self.getPlacementDimensions(), self.args.single,
+		self.args.careful, self.session.iconsHash, enabledSets):
+			raise ValueError(
+			"Plan {} was made for a font with different metrics or options".format(
+			self.args.planIn))
+
+	def replanSlots(self, plan):
+		""" Decides again which careful operations of a plan are skipped, for the
+		font the plan is applied to. A plan made for another font of a family
+		skipped the slots that font had, this font may have others """
+		plannedSlots = CodepointBitset()
+		for planSet in plan['sets']:
+			skipped = {} # position: the operations skipped there, in plan order
+			for operation in planSet['skipped']:
+				skipped.setdefault(operation.pop('position'), []).append(operation)
+			# Every operation of the set in the order it was planned in
+			operations = []
+			for position in range(len(planSet['operations']) + 1):
+				operations.extend(skipped.get(position, ()))
+				operations.extend(planSet['operations'][position:position + 1])
+			planSet.update(operations=[], skipped=[], conflicts=[])
+			self.selectOperations(planSet, operations, plannedSlots)
+
+	def getPlanPath(self):
+		""" Returns where to write the plan, a directory given as --plan-out gets
+		one plan per font """
+		if isdir(self.args.planOut):
+			return join(self.args.planOut, self.sourceFont.fullname + ".plan.json")
+		return self.args.planOut
+
+	def getPlacementDimensions(self):
+		""" Returns the values of self.fontDim the glyph placement depends on """
+		return {key: self.fontDim[key] for key in PLACEMENT_DIMENSIONS}
+
+	def getGlyphCacheKey(self, patch):
+		""" Returns the glyph cache key of a patch set entry for self.sourceFont.
+		Everything that affects the scale and position of the glyphs is hashed """
+		keyData = [
+		VERSION, self.session.getSymbolFontHash(patch['Filename']),
+		self.sourceFont.em, self.getPlacementDimensions(),
+		self.args.single, patch['SymStart'], patch['SymEnd'], patch['SrcStart'],
+		patch['SrcEnd'], patch['Exact'], patch['ScaleGlyph'], patch['Attributes'],
+		self.session.iconsHash, bool(self.args.outlineStore)]
+		return sha256(json.dumps(keyData, default=str).encode("utf-8")).hexdigest()
+
+	def analyzeSourceFont(self):
+		""" Returns the FontMetrics of self.sourceFont, read from the metrics
+		cache when this font file was analyzed before """
+		if not self.args.metricsCache:
+			return analyzeFont(self.sourceFont)
+		path = getMetricsCachePath(self.args.metricsCache, self.args.font)
+		metrics = loadFontMetrics(path)
+		if metrics is None:
+			metrics = analyzeFont(self.sourceFont)
+			saveFontMetrics(metrics, path)
+		return metrics
 
 	def setSourceFontGlyphWidths(self):
-		""" Makes self.sourceFont monospace compliant """
-
-		for glyph in self.sourceFont.glyphs():
-			if (glyph.width == self.fontDim['width']):
+		""" Makes self.sourceFont monospace compliant. Only the glyphs whose width
+		in self.metrics differs are visited. Returns the number of glyphs of each
+		kind: 'adjusted', zero width 'marks' (adjusted but keeping their bearings),
+		'skipped' (width already right) and 'failed' """
+		counts = {'adjusted': 0, 'marks': 0, 'skipped': 0, 'failed': 0}
+		failures = [] # glyph name and error of the first failed glyphs
+		for index, width in enumerate(self.metrics.widths):
+			if (width == self.fontDim['width']):
 				# Don't tough the (negative) bearings if the width is ok
 				# Ligartures will have these.
+				counts['skipped'] += 1
 				continue
 
-			if (glyph.width != 0):
+			errors = []
+			name = self.metrics.names[index]
+			try:
+				glyph = self.sourceFont[name]
+				if (width != 0 and self.args.buildProfile == 'release'):
+					# If width is not zero, correct the bearings such that they are within the width.
+					# Drafts keep the bearings, the glyph may then overhang its cell.
+					# The width is set even if this fails, as it was before
+					try:
+						self.removeGlyphNegBearings(glyph)
+					except Exception as exception: # fontforge raises several types
+						errors.append(exception)
+				self.setGlyphWidthMono(glyph)
+			except Exception as exception:
+				errors.append(exception)
+
+			if errors:
+				counts['failed'] += 1
+				if len(failures) < 5:
+					failures.append("{} ({})".format(name, errors[0]))
+			elif width == 0:
 				# If the width is zero this glyph is intened to be printed on top of another one.
 				# In this case we need to keep the negative bearings to shift it 'left'.
 				# Things like &Auml; have these: composed of U+0041 'A' and U+0308 'double dot above'
-				#
-				# If width is not zero, correct the bearings such that they are within the width:
-				self.removeGlyphNegBearings(glyph)
+				counts['marks'] += 1
+			else:
+				counts['adjusted'] += 1
 
-			self.setGlyphWidthMono(glyph)
+		if failures:
+			sys.stderr.write("{}: Could not set the width of {} glyphs: {}{}\n".format(
+			PROJECT_NAME, counts['failed'], ", ".join(failures),
+			" ..." if counts['failed'] > len(failures) else ""))
+		return counts
 
 	def removeGlyphNegBearings(self, glyph):
 		""" Sets passed glyph's bearings 0.0 if they are negative. """
-		try:
-			if glyph.left_side_bearing < 0.0:
-				glyph.left_side_bearing = 0.0
-			if glyph.right_side_bearing < 0.0:
-				glyph.right_side_bearing = 0.0
-		except:
-			pass
+		if glyph.left_side_bearing < 0.0:
+			glyph.left_side_bearing = 0.0
+		if glyph.right_side_bearing < 0.0:
+			glyph.right_side_bearing = 0.0
 
 	def setGlyphWidthMono(self, glyph):
 		""" Sets passed glyph.width to self.fontDim.width.
 
 		self.fontDim.width is set with self.get_sourcefontDimensions().
 		"""
+		glyph.width = self.fontDim['width']
+
+
+def getExactEncodingPositions(args):
+	""" Returns whether the octicons and font linux glyphs keep their exact
+	encoding positions, preventing conflicts between glyph sets """
+	# For compatibility with the rest of nerdfonts we dont want to keep the
+	# encoding positions for the following
+	octiconsExactEncodingPosition = not args.compat
+	fontlinuxExactEncodingPosition = not args.compat
+	if args.fontawesome and args.octicons:
+		octiconsExactEncodingPosition = False
+	if args.fontawesome or args.octicons:
+		fontlinuxExactEncodingPosition = False
+	return octiconsExactEncodingPosition, fontlinuxExactEncodingPosition
+
+
+def getPatchSet(args):
+	""" Creates list of dicts to with instructions on copying glyphs from
+	each symbol font into the source font """
+	(octiconsExactEncodingPosition,
+	fontlinuxExactEncodingPosition) = getExactEncodingPositions(args)
+
+	# Supported params: overlap | careful
+	# Powerline dividers
+	symAttrPowerline = {
+	'default': {'align': 'c', 'valign': 'c', 'stretch': 'pa', 'params': ''},
+
+	# Arrow tips
+	0xe0b0: {
+	'align': 'l', 'valign': 'c', 'stretch': 'xy',
+	'params': {'overlap': 0.02}}, 0xe0b1: {
+	'align': 'l', 'valign': 'c', 'stretch': 'xy',
+	'params': {'overlap': 0.02}}, 0xe0b2: {
+	'align': 'r', 'valign': 'c', 'stretch': 'xy',
+	'params': {'overlap': 0.02}}, 0xe0b3: {
+	'align': 'r', 'valign': 'c', 'stretch': 'xy', 'params': {'overlap': 0.02}},
+
+	# Rounded arcs
+	0xe0b4: {
+	'align': 'l', 'valign': 'c', 'stretch': 'xy',
+	'params': {'overlap': 0.01}}, 0xe0b5: {
+	'align': 'l', 'valign': 'c', 'stretch': 'xy',
+	'params': {'overlap': 0.01}}, 0xe0b6: {
+	'align': 'r', 'valign': 'c', 'stretch': 'xy', 'params': {'overlap': 0.01}},
+	0xe0b7: {
+	'align': 'r', 'valign': 'c', 'stretch': 'xy', 'params': {'overlap': 0.01}},
+
+	# Bottom Triangles
+	0xe0b8: {
+	'align': 'l', 'valign': 'c', 'stretch': 'xy',
+	'params': {'overlap': 0.02}}, 0xe0b9: {
+	'align': 'l', 'valign': 'c', 'stretch': 'xy',
+	'params': {'overlap': 0.02}}, 0xe0ba: {
+	'align': 'r', 'valign': 'c', 'stretch': 'xy',
+	'params': {'overlap': 0.02}}, 0xe0bb: {
+	'align': 'r', 'valign': 'c', 'stretch': 'xy', 'params': {'overlap': 0.02}},
+
+	# Top Triangles
+	0xe0bc: {
+	'align': 'l', 'valign': 'c', 'stretch': 'xy',
+	'params': {'overlap': 0.02}}, 0xe0bd: {
+	'align': 'l', 'valign': 'c', 'stretch': 'xy',
+	'params': {'overlap': 0.02}}, 0xe0be: {
+	'align': 'r', 'valign': 'c', 'stretch': 'xy',
+	'params': {'overlap': 0.02}}, 0xe0bf: {
+	'align': 'r', 'valign': 'c', 'stretch': 'xy', 'params': {'overlap': 0.02}},
+
+	# Flames
+	0xe0c0: {
+	'align': 'l', 'valign': 'c', 'stretch': 'xy',
+	'params': {'overlap': 0.01}}, 0xe0c1: {
+	'align': 'l', 'valign': 'c', 'stretch': 'xy',
+	'params': {'overlap': 0.01}}, 0xe0c2: {
+	'align': 'r', 'valign': 'c', 'stretch': 'xy',
+	'params': {'overlap': 0.01}}, 0xe0c3: {
+	'align': 'r', 'valign': 'c', 'stretch': 'xy', 'params': {'overlap': 0.01}},
+
+	# Small squares
+	0xe0c4: {'align': 'l', 'valign': 'c', 'stretch': 'xy', 'params': ''},
+	0xe0c5: {'align': 'r', 'valign': 'c', 'stretch': 'xy', 'params': ''},
+
+	# Bigger squares
+	0xe0c6: {'align': 'l', 'valign': 'c', 'stretch': 'xy', 'params': ''},
+	0xe0c7: {'align': 'r', 'valign': 'c', 'stretch': 'xy', 'params': ''},
+
+	# Waveform
+	0xe0c8: {
+	'align': 'l', 'valign': 'c', 'stretch': 'xy', 'params': {'overlap': 0.01}},
+
+	# Hexagons
+	0xe0cc: {'align': 'l', 'valign': 'c', 'stretch': 'xy', 'params': ''},
+	0xe0cd: {'align': 'l', 'valign': 'c', 'stretch': 'xy', 'params': ''},
+
+	# Legos
+	0xe0ce: {'align': 'l', 'valign': 'c', 'stretch': 'xy', 'params': ''},
+	0xe0cf: {'align': 'c', 'valign': 'c', 'stretch': 'xy',
+	'params': ''}, 0xe0d1: {
+	'align': 'l', 'valign': 'c', 'stretch': 'xy', 'params': {'overlap': 0.02}},
+
+	# Top and bottom trapezoid
+	0xe0d2: {
+	'align': 'l', 'valign': 'c', 'stretch': 'xy',
+	'params': {'overlap': 0.02}}, 0xe0d4: {
+	'align': 'r', 'valign': 'c', 'stretch': 'xy', 'params': {'overlap': 0.02}}}
+
+	symAttrDefault = {
+	# 'pa' == preserve aspect ratio
+	'default': {'align': 'c', 'valign': 'c', 'stretch': 'pa', 'params': ''}}
+
+	symAttrFontA = {
+	# 'pa' == preserve aspect ratio
+	'default': {'align': 'c', 'valign': 'c', 'stretch': 'pa', 'params': ''},
+
+	# Don't center these arrows vertically
+	0xf0dc: {'align': 'c', 'valign': '', 'stretch': 'pa', 'params': ''},
+	0xf0dd: {'align': 'c', 'valign': '', 'stretch': 'pa', 'params': ''},
+	0xf0de: {'align': 'c', 'valign': '', 'stretch': 'pa', 'params': ''}}
+
+	customAttr = {
+	# 'pa' == preserve aspect ratio
+	'default': {'align': 'c', 'valign': '', 'stretch': '', 'params': ''}}
+
+	# Most glyphs we want to maximize during the scale.  However, there are some
+	# that need to be small or stay relative in size to each other.
+	# The following list are those glyphs.  A tuple represents a range.
+	deviScaleList = {'ScaleGlyph': 0xE60E, 'GlyphsToScale': [(0xe6bd, 0xe6c3)]}
+	fontAScaleList = {
+	'ScaleGlyph': 0xF17A, 'GlyphsToScale': [
+	0xf005, 0xf006, (0xf026, 0xf028), 0xf02b, 0xf02c, (0xf031, 0xf035),
+	(0xf044, 0xf054), (0xf060, 0xf063), 0xf077, 0xf078, 0xf07d, 0xf07e, 0xf089,
+	(0xf0d7, 0xf0da), (0xf0dc, 0xf0de), (0xf100, 0xf107), 0xf141, 0xf142,
+	(0xf153, 0xf15a), (0xf175, 0xf178), 0xf182, 0xf183, (0xf221, 0xf22d),
+	(0xf255, 0xf25b)]}
+	octiScaleList = {
+	'ScaleGlyph': 0xF02E, 'GlyphsToScale': [(0xf03d, 0xf040), 0xf044,
+	(0xf051, 0xf053), 0xf05a, 0xf05b, 0xf071, 0xf078, (0xf09f, 0xf0aa), 0xf0ca]}
+
+	# Define the character ranges
+	# Symbol font ranges
+	# yapf: disable
+	patchSet = [
+	{'Enabled': True, 'Name': "Seti-UI + Custom",
+	'Filename': "original-source.otf", 'Exact': False, 'SymStart': 0xE4FA,
+	'SymEnd': 0xE52E, 'SrcStart': 0xE5FA, 'SrcEnd': 0xE62E, 'ScaleGlyph': None,
+	'Attributes': symAttrDefault},
+	{'Enabled': True, 'Name': "Devicons",
+	'Filename': "devicons.ttf",	'Exact': False, 'SymStart': 0xE600,
+	'SymEnd': 0xE6C5, 'SrcStart': 0xE700, 'SrcEnd': 0xE7C5, 'ScaleGlyph': deviScaleList,
+	'Attributes': symAttrDefault},
+	{'Enabled': args.powerline, 'Name': "Powerline Symbols",
+	'Filename': "PowerlineSymbols.otf", 'Exact': True, 'SymStart': 0xE0A0,
+	'SymEnd': 0xE0A2, 'SrcStart': None, 'SrcEnd': None, 'ScaleGlyph': None,
+	'Attributes': symAttrPowerline},
+	{'Enabled': args.powerline, 'Name': "Powerline Symbols",
+	'Filename': "PowerlineSymbols.otf", 'Exact': True, 'SymStart': 0xE0B0,
+	'SymEnd': 0xE0B3, 'SrcStart': None, 'SrcEnd': None, 'ScaleGlyph': None,
+	'Attributes': symAttrPowerline},
+	{'Enabled': args.powerlineextra, 'Name': "Powerline Extra Symbols",
+	'Filename': "PowerlineExtraSymbols.otf", 'Exact': True, 'SymStart': 0xE0A3,
+	'SymEnd': 0xE0A3, 'SrcStart': None, 'SrcEnd': None, 'ScaleGlyph': None,
+	'Attributes': symAttrPowerline},
+	{'Enabled': args.powerlineextra, 'Name': "Powerline Extra Symbols",
+	'Filename': "PowerlineExtraSymbols.otf", 'Exact': True, 'SymStart': 0xE0B4,
+	'SymEnd': 0xE0C8, 'SrcStart': None, 'SrcEnd': None, 'ScaleGlyph': None,
+	'Attributes': symAttrPowerline},
+	{'Enabled': args.powerlineextra, 'Name': "Powerline Extra Symbols",
+	'Filename': "PowerlineExtraSymbols.otf", 'Exact': True, 'SymStart': 0xE0CA,
+	'SymEnd': 0xE0CA, 'SrcStart': None, 'SrcEnd': None, 'ScaleGlyph': None,
+	'Attributes': symAttrPowerline},
+	{'Enabled': args.powerlineextra, 'Name': "Powerline Extra Symbols",
+	'Filename': "PowerlineExtraSymbols.otf", 'Exact': True, 'SymStart': 0xE0CC,
+	'SymEnd': 0xE0D4, 'SrcStart': None, 'SrcEnd': None, 'ScaleGlyph': None,
+	'Attributes': symAttrPowerline},
+	{'Enabled': args.pomicons, 'Name': "Pomicons",
+	'Filename': "Pomicons.otf", 'Exact': True, 'SymStart': 0xE000,
+	'SymEnd': 0xE00A, 'SrcStart': None, 'SrcEnd': None, 'ScaleGlyph': None,
+	'Attributes': symAttrDefault},
+	{'Enabled': args.fontawesome, 'Name': "Font Awesome",
+	'Filename': "FontAwesome.otf", 'Exact': True, 'SymStart': 0xF000,
+	'SymEnd': 0xF2E0, 'SrcStart': None, 'SrcEnd': None, 'ScaleGlyph': fontAScaleList,
+	'Attributes': symAttrFontA},
+	{'Enabled': args.fontawesomeextension, 'Name': "Font Awesome Extension",
+	'Filename': "font-awesome-extension.ttf", 'Exact': False, 'SymStart': 0xE000,
+	'SymEnd': 0xE0A9, 'SrcStart': 0xE200, 'SrcEnd': 0xE2A9, 'ScaleGlyph': None,
+	'Attributes': symAttrDefault}, # Maximize
+	{'Enabled': args.powersymbols, 'Name': "Power Symbols",
+	'Filename': "Unicode_IEC_symbol_font.otf", 'Exact': True, 'SymStart': 0x23FB,
+	'SymEnd': 0x23FE, 'SrcStart': None, 'SrcEnd': None, 'ScaleGlyph': None,
+	'Attributes': symAttrDefault}, # Power, Power On/Off, Power On, Sleep
+	{'Enabled': args.powersymbols, 'Name': "Power Symbols",
+	'Filename': "Unicode_IEC_symbol_font.otf", 'Exact': True, 'SymStart': 0x2B58,
+	'SymEnd': 0x2B58, 'SrcStart': None, 'SrcEnd': None, 'ScaleGlyph': None,
+	'Attributes': symAttrDefault}, # Heavy Circle (aka Power Off)
+	{'Enabled': args.material, 'Name': "Material",
+	'Filename': "materialdesignicons-webfont.ttf", 'Exact': False, 'SymStart': 0xF001,
+	'SymEnd': 0xF847, 'SrcStart': 0xF500, 'SrcEnd': 0xFD46, 'ScaleGlyph': None,
+	'Attributes': symAttrDefault},
+	{'Enabled': args.weather, 'Name': "Weather Icons",
+	'Filename': "weathericons-regular-webfont.ttf", 'Exact': False,
+	'SymStart': 0xF000, 'SymEnd': 0xF0EB, 'SrcStart': 0xE300, 'SrcEnd': 0xE3EB, 'ScaleGlyph': None,
+	'Attributes': symAttrDefault},
+	{'Enabled': args.fontlinux, 'Name': "Font Logos (Font Linux)",
+	'Filename': "font-logos.ttf", 'Exact': fontlinuxExactEncodingPosition,
+	'SymStart': 0xF100, 'SymEnd': 0xF11C, 'SrcStart': 0xF300, 'SrcEnd': 0xF31C, 'ScaleGlyph': None,
+	'Attributes': symAttrDefault},
+	{'Enabled': args.octicons, 'Name': "Octicons",
+	'Filename': "octicons.ttf", 'Exact': octiconsExactEncodingPosition,
+	'SymStart': 0xF000, 'SymEnd': 0xF105, 'SrcStart': 0xF400, 'SrcEnd': 0xF505,
+	'ScaleGlyph': octiScaleList, 'Attributes': symAttrDefault}, # Magnifying glass
+	{'Enabled': args.octicons, 'Name': "Octicons",
+	'Filename': "octicons.ttf", 'Exact': octiconsExactEncodingPosition,
+	'SymStart': 0x2665, 'SymEnd': 0x2665, 'SrcStart': None, 'SrcEnd': None,
+	'ScaleGlyph': octiScaleList, 'Attributes': symAttrDefault}, # Heart
+	{'Enabled': args.octicons, 'Name': "Octicons",
+	'Filename': "octicons.ttf", 'Exact': octiconsExactEncodingPosition,
+	'SymStart': 0X26A1, 'SymEnd': 0X26A1, 'SrcStart': None, 'SrcEnd': None,
+	'ScaleGlyph': octiScaleList, 'Attributes': symAttrDefault}, # Zap
+	{'Enabled': args.octicons, 'Name': "Octicons",
+	'Filename': "octicons.ttf", 'Exact': octiconsExactEncodingPosition,
+	#'SymStart': 0xF27C, 'SymEnd': 0xF27C, 'SrcStart': 0xF4A9, 'SrcEnd': 0xF4A9,
+	'SymStart': 0xF27C, 'SymEnd': 0xF2BD, 'SrcStart': 0xF4A9, 'SrcEnd': 0xF4EA,
+	'ScaleGlyph': octiScaleList, 'Attributes': symAttrDefault}, # Desktop
+	{'Enabled': args.custom, 'Name': "Custom",
+	'Filename': args.custom, 'Exact': True,
+	'SymStart': 0x0000, 'SymEnd': 0x0000, 'SrcStart': 0x0000, 'SrcEnd': 0x0000,
+	'ScaleGlyph': None, 'Attributes': customAttr}]
+
+	# yapf: enable
+	return patchSet
+
+
+class Profiler:
+	""" Records timing spans of the patching stages for --profile, written as
+	a Chrome trace (chrome://tracing, Perfetto) and printed as a summary table.
+	With cProfileEnabled the spans marked hot are also run under cProfile """
+
+	def __init__(self, enabled, cProfileEnabled=False):
+		self.enabled = enabled
+		self.cProfile = cProfile.Profile() if cProfileEnabled else None
+		self.origin = perf_counter()
+		self.spans = [] # (name, start, end, args) in seconds since self.origin
+
+	@contextmanager
+	def span(self, name, hot=False):
+		""" Times the enclosed block as name, yielding a dict for counts to be
+		recorded with it. Does nothing when the profiler is disabled """
+		args = {}
+		if not self.enabled:
+			yield args
+			return
+		start = perf_counter()
+		if hot and self.cProfile:
+			self.cProfile.enable()
 		try:
-			glyph.width = self.fontDim['width']
-		except:
+			yield args
+		finally:
+			if hot and self.cProfile:
+				self.cProfile.disable()
+			end = perf_counter()
+			peakRSS = getPeakRSS()
+			if peakRSS is not None:
+				args['peakRSS'] = peakRSS
+			self.spans.append((name, start - self.origin, end - self.origin, args))
+
+	def writeTrace(self, path):
+		""" Writes the spans to path as Chrome trace event json """
+		pid = getpid()
+		traceEvents = [{
+		'name': name, 'cat': name.split(" ")[0], 'ph': 'X', 'pid': pid, 'tid': 0,
+		'ts': round(start * 1e6), 'dur': round((end - start) * 1e6), 'args': args}
+		for name, start, end, args in self.spans]
+		with open(path, "w") as traceFile:
+			json.dump({'traceEvents': traceEvents, 'displayTimeUnit': 'ms'}, traceFile)
+
+	def printSummary(self, title):
+		""" Prints the time, glyph counts and peak RSS of each stage """
+		total = sum(end - start for _, start, end, _ in self.spans) or 1
+		print("\nProfile of {}".format(title))
+		print("{:<40} {:>9} {:>6} {:>7} {:>7} {:>9}".format("Stage", "Seconds", "%",
+		"Glyphs", "Skipped", "Peak MB"))
+		for name, start, end, args in self.spans:
+			print("{:<40} {:>9.3f} {:>6.1f} {:>7} {:>7} {:>9}".format(name[:40],
+			end - start, 100 * (end - start) / total, args.get('glyphs', ""),
+			args.get('skipped', ""), "{:.1f}".format(args['peakRSS'] / 1048576)
+			if 'peakRSS' in args else ""))
+
+
+class ProgressReporter:
+	""" Reports the glyph sets being added to a font. Progress bars are drawn
+	at most PROGRESS_RATE times a second, and only on a terminal unless
+	--progressbars asks for them. Otherwise each set gets a one line summary.
+	With --events every set is also written as json lines to a descriptor """
+
+	def __init__(self, args):
+		self.font = args.font
+		self.quiet = args.quiet
+		self.progressbars = args.progressbars
+		if self.progressbars is None:
+			self.progressbars = sys.stdout.isatty()
+		self.progressbars = self.progressbars and not self.quiet
+		self.events = args.events # file descriptor or None
+		self.setName = None
+		self.total = 0
+		self.done = 0
+		self.start = 0
+		self.lastDraw = 0
+
+	def message(self, text):
+		""" Prints text unless quiet """
+		if not self.quiet:
+			print(text)
+
+	def event(self, event, **fields):
+		""" Writes an event about this font if --events was given """
+		if self.events is not None:
+			writeEvent(self.events, event, font=self.font, **fields)
+
+	def startSet(self, name, total, cached):
+		""" Starts reporting a set of total glyphs """
+		self.setName = name
+		self.total = total
+		self.done = 0
+		self.start = perf_counter()
+		self.lastDraw = 0
+		if not self.quiet:
+			sys.stdout.write("Adding " + str(max(1, total)) + " Glyphs from " + name +
+			" Set " + ("(cached)" if cached else "") + "\n")
+		self.event("setStarted", set=name, glyphs=total, cached=cached)
+
+	def update(self, done):
+		""" Records that done glyphs of the set were added """
+		self.done = done
+		if self.progressbars:
+			now = perf_counter()
+			if now - self.lastDraw >= 1.0 / PROGRESS_RATE:
+				self.lastDraw = now
+				updateProgress(float(done) / max(1, self.total))
+
+	def finishSet(self, skipped):
+		""" Ends the set, skipped being the number of glyphs left out """
+		seconds = perf_counter() - self.start
+		if self.progressbars:
+			updateProgress(1)
+			sys.stdout.write("\n")
+		elif not self.quiet:
+			print("  Added {} Glyphs, skipped {} in {:.2f}s".format(self.done, skipped,
+			seconds))
+		self.event("setFinished", set=self.setName, added=self.done, skipped=skipped,
+		seconds=round(seconds, 6))
+
+
+def forkCall(function, resultFd, index, newGroup=False):
+	""" Calls function in a forked child and returns the child's pid. If the
+	function raises, the error is written to resultFd as a json line with index.
+	With newGroup the child leads a process group of its own, which the
+	processes it forks join """
+	# Pending output would be written again by the child
+	sys.stdout.flush()
+	sys.stderr.flush()
+	pid = os.fork()
+	if pid == 0:
+		status = 1
+		try:
+			if newGroup:
+				os.setpgid(0, 0)
+			function()
+			status = 0
+		except Exception as exception:
+			traceback.print_exc()
+			write(resultFd, (json.dumps({
+			'index': index, 'error': "{}: {}".format(type(exception).__name__,
+			exception)}) + "\n").encode("utf-8"))
+		finally:
+			sys.stdout.flush()
+			sys.stderr.flush()
+			_exit(status)
+	return pid
+
+
+def getVariantArgs(args):
+	""" Returns a copy of args for each distinct variant in args.variants,
+	with that variant's options switched on. Returns [args] without variants """
+	if not args.variants:
+		return [args]
+	variants = []
+	seen = set()
+	for variant in args.variants:
+		variantArgs = copy(args)
+		variantArgs.variants = None
+		for name in variant:
+			setattr(variantArgs, VARIANT_OPTIONS[name], True)
+		options = tuple(getattr(variantArgs, option) for option in VARIANT_OPTIONS.values())
+		if options not in seen:
+			seen.add(options)
+			variants.append(variantArgs)
+	return variants
+
+
+def writeEvent(fd, event, **fields):
+	""" Writes an event as a json line to file descriptor fd. Each line is a
+	single write so the lines of parallel workers do not interleave """
+	fields.update({'event': event, 'time': round(time(), 6), 'pid': getpid()})
+	write(fd, (json.dumps(fields, sort_keys=True) + "\n").encode("utf-8"))
+
+
+def getPeakRSS():
+	""" Returns the peak resident set size of this process in bytes, or None
+	where the resource module is not available """
+	if resource is None:
+		return None
+	peakRSS = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# Linux reports kilobytes, macOS bytes
+	return peakRSS if sys.platform == "darwin" else peakRSS * 1024
+
+
+def compilePatchTable(patch, codepoints):
+	""" Compiles a patch set entry into a PatchTable: the target slot of each
+	symbol codepoint, the attributes with the index of each codepoint's
+	attributes (0 is the default) and the glyphs to scale as sorted, merged
+	intervals. codepoints lists the [unicode, encoding] of the selected symbol
+	glyphs (see PatchSession.getSymbolCodepoints), or is None for entries that
+	copy every glyph to its own encoding """
+	targets = None
+	if codepoints is not None:
+		if patch['Exact']:
+			# use the exact same encoding for the source font as for the symbol font
+			targets = {
+			unicode: encoding for unicode, encoding in codepoints if unicode >= 0}
+		else:
+			# the n-th selected glyph goes to the n-th slot of the source range,
+			# which defaults to the symbol font range
+			sourceFontStart = patch['SrcStart'] or patch['SymStart']
+			sourceFontEnd = patch['SrcEnd'] or patch['SymEnd']
+			targets = dict(zip((unicode for unicode, _ in codepoints),
+			range(sourceFontStart, sourceFontEnd + 1)))
+
+	attributes = [patch['Attributes']['default']]
+	attributeIds = {}
+	for unicode, symAttr in patch['Attributes'].items():
+		if unicode != 'default':
+			attributeIds[unicode] = len(attributes)
+			attributes.append(symAttr)
+
+	intervals = []
+	if patch['ScaleGlyph']:
+		for i in sorted(
+		i if isinstance(i, tuple) else (i, i)
+		for i in patch['ScaleGlyph']['GlyphsToScale']):
+			if intervals and i[0] <= intervals[-1][1] + 1:
+				intervals[-1] = (intervals[-1][0], max(intervals[-1][1], i[1]))
+			else:
+				intervals.append(i)
+	return PatchTable(targets, tuple(attributes), attributeIds,
+	array('i', (start for start, _ in intervals)),
+	array('i', (end for _, end in intervals)))
+
+
+class GlyphCache:
+	""" On-disk cache of scaled and positioned symbol glyphs, one gzipped json
+	file per patch set entry. Least recently used entries are evicted once the
+	cache grows beyond maxBytes """
+
+	def __init__(self, directory, maxBytes):
+		self.directory = directory
+		self.maxBytes = maxBytes
+		makeSurePathExists(self.directory)
+
+	def get(self, key):
+		""" Returns the list of cached glyphs for key, or None on a miss """
+		path = join(self.directory, key + ".json.gz")
+		try:
+			with gzip.open(path, "rt", encoding="utf-8") as cacheFile:
+				cachedGlyphs = json.load(cacheFile)
+		except (OSError, ValueError):
+			return None
+		try:
+			utime(path) # mark as recently used
+		except OSError:
 			pass
+		return cachedGlyphs
+
+	def put(self, key, cachedGlyphs):
+		""" Stores cachedGlyphs under key then evicts old entries if needed """
+		path = join(self.directory, key + ".json.gz")
+		# Write then rename so concurrent workers never read a partial entry
+		tempPath = "{}.{}.tmp".format(path, getpid())
+		with gzip.open(tempPath, "wt", encoding="utf-8") as cacheFile:
+			json.dump(cachedGlyphs, cacheFile, separators=(',', ':'))
+		replace(tempPath, path)
+		self.evict()
+
+	def evict(self):
+		""" Removes least recently used entries until within self.maxBytes """
+		entries = []
+		for name in listdir(self.directory):
+			if name.endswith(".json.gz"):
+				try:
+					entryStat = stat(join(self.directory, name))
+				except OSError:
+					continue
+				entries.append((entryStat.st_mtime, entryStat.st_size, name))
+		totalBytes = sum(size for _, size, _ in entries)
+		for _, size, name in sorted(entries):
+			if totalBytes <= self.maxBytes:
+				break
+			try:
+				remove(join(self.directory, name))
+			except OSError:
+				pass
+			totalBytes -= size
+
+
+class OutputCache:
+	""" Content addressed cache of patched fonts. Each entry is a directory
+	named after its key holding the generated files and an outputs.json
+	listing them """
+
+	def __init__(self, directory):
+		self.directory = directory
+		makeSurePathExists(self.directory)
+
+	def restore(self, key, outputdir):
+		""" Hard links (or copies) the cached outputs for key into outputdir.
+		Returns the list of output paths and the bytes they hold, or None on a
+		miss """
+		entryDir = join(self.directory, key)
+		try:
+			with open(join(entryDir, "outputs.json"), "r", encoding="utf-8") as manifest:
+				names = json.load(manifest)
+		except (OSError, ValueError):
+			return None
+		makeSurePathExists(outputdir)
+		outputs = []
+		bytesSaved = 0
+		for name in names:
+			cachedPath = join(entryDir, name)
+			outputPath = outputdir + "/" + name
+			if isfile(outputPath):
+				remove(outputPath)
+			try:
+				link(cachedPath, outputPath)
+			except OSError:
+				copyfile(cachedPath, outputPath)
+			outputs.append(outputPath)
+			bytesSaved += getsize(cachedPath)
+		return outputs, bytesSaved
+
+	def put(self, key, outputPaths):
+		""" Copies the generated outputPaths into the cache under key """
+		entryDir = join(self.directory, key)
+		# Fill a private directory then rename it, so concurrent workers never
+		# see a partial entry
+		tempDir = "{}.{}.tmp".format(entryDir, getpid())
+		makeSurePathExists(tempDir)
+		for outputPath in outputPaths:
+			copyfile(outputPath, join(tempDir, basename(outputPath)))
+		with open(join(tempDir, "outputs.json"), "w", encoding="utf-8") as manifest:
+			json.dump([basename(outputPath) for outputPath in outputPaths], manifest)
+		try:
+			rename(tempDir, entryDir)
+		except OSError:
+			# Another worker stored the same entry first
+			rmtree(tempDir, ignore_errors=True)
+
+
+class CodepointBitset:
+	""" Set of codepoints held as one bit per codepoint in a bytearray, for
+	constant time membership tests. Grows up to the largest codepoint added """
+
+	def __init__(self, codepoints=()):
+		self.bits = bytearray()
+		for codepoint in codepoints:
+			self.add(codepoint)
+
+	def add(self, codepoint):
+		""" Adds codepoint, which must not be negative """
+		index = codepoint >> 3
+		if index >= len(self.bits):
+			self.bits.extend(bytes(index + 1 - len(self.bits)))
+		self.bits[index] |= 1 << (codepoint & 7)
+
+	def __contains__(self, codepoint):
+		""" Returns True if codepoint was added """
+		index = codepoint >> 3
+		return 0 <= index < len(self.bits) and bool(
+		self.bits[index] & (1 << (codepoint & 7)))
+
+
+class FontMetrics:
+	""" Metrics of every glyph of a font held in flat arrays sharing one index:
+	glyph names, unicode values, advance widths and bounding boxes (four values
+	per glyph). The codepoints the font occupies are kept sorted and in a
+	bitset built once, which the careful checks test """
+
+	def __init__(self, names, unicodes, widths, bboxes, codepoints):
+		self.names = names # class 'list'
+		self.unicodes = unicodes # class 'array', -1 for unencoded glyphs
+		self.widths = widths # class 'array'
+		self.bboxes = bboxes # class 'array', xmin ymin xmax ymax per glyph
+		self.codepoints = codepoints # class 'array', sorted and unique
+		self.occupied = CodepointBitset(codepoints)
+
+	def hasCodepoint(self, codepoint):
+		""" Returns True if a glyph of the font is mapped to codepoint """
+		return codepoint in self.occupied
+
+
+def analyzeFont(font):
+	""" Returns the FontMetrics of font, visiting each of its glyphs once """
+	names = []
+	unicodes = array('i')
+	widths = array('d')
+	bboxes = array('d')
+	codepoints = set()
+	for glyph in font.glyphs():
+		names.append(glyph.glyphname)
+		unicodes.append(glyph.unicode)
+		widths.append(glyph.width)
+		bboxes.extend(glyph.boundingBox())
+		if glyph.unicode >= 0:
+			codepoints.add(glyph.unicode)
+		# Alternate encodings occupy their codepoints as well
+		for altUnicode in glyph.altuni or ():
+			if altUnicode[0] >= 0:
+				codepoints.add(altUnicode[0])
+	return FontMetrics(names, unicodes, widths, bboxes,
+	array('i', sorted(codepoints)))
+
+
+def getMetricsCachePath(directory, font):
+	""" Returns the path of the FontMetrics of the font file at font in the
+	metrics cache directory, named by the hash of the file """
+	makeSurePathExists(directory)
+	return join(directory, getFileHash(font) + ".json.gz")
+
+
+def loadFontMetrics(path):
+	""" Returns the FontMetrics stored at path, or None if there are none """
+	try:
+		with gzip.open(path, "rt", encoding="utf-8") as metricsFile:
+			stored = json.load(metricsFile)
+		return FontMetrics(stored['names'], array('i', stored['unicodes']),
+		array('d', stored['widths']), array('d', stored['bboxes']),
+		array('i', stored['codepoints']))
+	except (OSError, ValueError, KeyError, TypeError):
+		return None
+
+
+def saveFontMetrics(metrics, path):
+	""" Writes metrics to path, see loadFontMetrics """
+	tempPath = "{}.{}.tmp".format(path, getpid())
+	with gzip.open(tempPath, "wt", encoding="utf-8") as metricsFile:
+		json.dump({
+		'names': metrics.names, 'unicodes': metrics.unicodes.tolist(),
+		'widths': metrics.widths.tolist(), 'bboxes': metrics.bboxes.tolist(),
+		'codepoints': metrics.codepoints.tolist()}, metricsFile,
+		separators=(',', ':'))
+	replace(tempPath, path)
+
+
+class OutlineStore:
+	""" The glyphs of a symbol font at its own em, extracted by
+	saveOutlineStore into flat arrays of a memory mapped file: unicode,
+	encoding, width and bounding box (4 values) per glyph, the contours of glyph
+	i being contourStarts[i] to contourStarts[i + 1] and the points of contour c
+	pointStarts[c] to pointStarts[c + 1]. Forked workers share the pages """
+
+	def __init__(self, em, names, arrays):
+		self.em = em
+		self.names = names # class 'list', glyph names
+		for name, _ in OUTLINE_STORE_ARRAYS:
+			setattr(self, name, arrays[name])
+		self.indexes = {encoding: index for index, encoding in enumerate(self.encodings)}
+
+
+class StoredSymbolFont:
+	""" A symbol font read from an OutlineStore. Has the parts of a fontforge
+	font the patcher reads: glyphs by encoding (see StoredGlyph) and selecting
+	by unicode range (see selectSymbolGlyphs) """
+
+	def __init__(self, store):
+		self.store = store
+
+	def __getitem__(self, encoding):
+		return StoredGlyph(self, self.store.indexes[encoding])
+
+	def selectGlyphs(self, start, end):
+		""" Returns the glyphs with a unicode from start to end, or every glyph
+		if start is 0, in the order of the font """
+		unicodes = self.store.unicodes
+		return [
+		StoredGlyph(self, index) for index in range(len(unicodes))
+		if start == 0 or start <= unicodes[index] <= end]
+
+	def getLayer(self, index, matrix):
+		""" Returns the outline of the glyph at index transformed by matrix, a
+		psMat matrix """
+		store = self.store
+		xx, xy, yx, yy, dx, dy = matrix
+		contours = range(store.contourStarts[index], store.contourStarts[index + 1])
+		layer = fontforge.layer()
+		# A layer only takes contours of its own order, TrueType ones are quadratic
+		layer.is_quadratic = any(
+		store.contourFlags[contourIndex] & 2 for contourIndex in contours)
+		for contourIndex in contours:
+			contour = fontforge.contour()
+			contour.is_quadratic = bool(store.contourFlags[contourIndex] & 2)
+			for pointIndex in range(store.pointStarts[contourIndex],
+			store.pointStarts[contourIndex + 1]):
+				x = store.points[2 * pointIndex]
+				y = store.points[2 * pointIndex + 1]
+				contour += fontforge.point(xx * x + yx * y + dx, xy * x + yy * y + dy,
+				bool(store.onCurve[pointIndex]))
+			contour.closed = bool(store.contourFlags[contourIndex] & 1)
+			layer += contour
+		return layer
+
+	def placeGlyph(self, encoding, targetGlyph, matrix):
+		""" Replaces targetGlyph with the symbol glyph at encoding, transformed
+		by matrix as its points are read """
+		targetGlyph.clear()
+		targetGlyph.foreground = self.getLayer(self.store.indexes[encoding],
+		tuple(matrix))
+
+	def close(self):
+		pass
+
+
+class StoredGlyph:
+	""" A glyph of a StoredSymbolFont, with the attributes of a fontforge
+	glyph that getGlyphDimensions, getGlyphOutline and transferGlyph read """
+	references = ()
+
+	def __init__(self, font, index):
+		self.font = font
+		self.index = index
+		self.unicode = font.store.unicodes[index]
+		self.encoding = font.store.encodings[index]
+		self.glyphname = font.store.names[index]
+		self.width = font.store.widths[index]
+
+	@property
+	def foreground(self):
+		return self.font.getLayer(self.index, psMat.identity())
+
+	def boundingBox(self):
+		bboxes = self.font.store.bboxes
+		return tuple(bboxes[4 * self.index:4 * self.index + 4])
+
+
+def selectSymbolGlyphs(symbolFont, start, end):
+	""" Returns the glyphs of symbolFont with a unicode from start to end, or
+	every glyph if start is 0 """
+	if isinstance(symbolFont, StoredSymbolFont):
+		return symbolFont.selectGlyphs(start, end)
+	if start == 0:
+		symbolFont.selection.all()
+	else:
+		symbolFont.selection.select((str("ranges"), str("unicode")), start, end)
+	return list(symbolFont.selection.byGlyphs)
+
+
+def saveOutlineStore(symbolFont, path):
+	""" Extracts every glyph of symbolFont, references unlinked, into an
+	outline store file at path: the signature, the length of a json header
+	with the em, glyph names and the position of each array, then the arrays
+	of OUTLINE_STORE_ARRAYS, each aligned to 8 bytes """
+	arrays = {name: array(typecode) for name, typecode in OUTLINE_STORE_ARRAYS}
+	names = []
+	symbolFont.selection.all()
+	for glyph in symbolFont.selection.byGlyphs:
+		names.append(glyph.glyphname)
+		arrays['unicodes'].append(glyph.unicode)
+		arrays['encodings'].append(glyph.encoding)
+		arrays['widths'].append(glyph.width)
+		arrays['bboxes'].extend(glyph.boundingBox())
+		arrays['contourStarts'].append(len(arrays['contourFlags']))
+		for contour in getGlyphOutline(glyph):
+			arrays['contourFlags'].append(int(contour.closed) |
+			int(contour.is_quadratic) << 1)
+			arrays['pointStarts'].append(len(arrays['onCurve']))
+			for point in contour:
+				arrays['points'].extend((point.x, point.y))
+				arrays['onCurve'].append(int(point.on_curve))
+	arrays['contourStarts'].append(len(arrays['contourFlags']))
+	arrays['pointStarts'].append(len(arrays['onCurve']))
+
+	data = []
+	positions = {}
+	offset = 0
+	for name, _ in OUTLINE_STORE_ARRAYS:
+		arrayBytes = arrays[name].tobytes()
+		positions[name] = (offset, len(arrayBytes))
+		data.append(arrayBytes + bytes(-len(arrayBytes) % 8))
+		offset += len(data[-1])
+	header = json.dumps({
+	'em': symbolFont.em, 'byteorder': sys.byteorder, 'names': names,
+	'arrays': positions}).encode("utf-8")
+	header += b" " * (-(len(OUTLINE_STORE_MAGIC) + 4 + len(header)) % 8)
+	# Written under a temporary name so a reader never maps half a store
+	temporaryPath = "{}.{}.tmp".format(path, getpid())
+	with open(temporaryPath, "wb") as storeFile:
+		storeFile.write(OUTLINE_STORE_MAGIC + struct.pack(">I", len(header)) + header)
+		for arrayBytes in data:
+			storeFile.write(arrayBytes)
+	replace(temporaryPath, path)
+
+
+def loadOutlineStore(path):
+	""" Maps the outline store file at path, returns its OutlineStore or None
+	if there is none or it was written differently """
+	try:
+		with open(path, "rb") as storeFile:
+			storeMap = mmap.mmap(storeFile.fileno(), 0, access=mmap.ACCESS_READ)
+	except (OSError, ValueError):
+		return None
+	start = len(OUTLINE_STORE_MAGIC) + 4
+	if storeMap[:len(OUTLINE_STORE_MAGIC)] != OUTLINE_STORE_MAGIC:
+		return None
+	headerLength = struct.unpack_from(">I", storeMap, len(OUTLINE_STORE_MAGIC))[0]
+	header = json.loads(storeMap[start:start + headerLength].decode("utf-8"))
+	if header['byteorder'] != sys.byteorder:
+		return None
+	start += headerLength
+	view = memoryview(storeMap)
+	arrays = {}
+	for name, typecode in OUTLINE_STORE_ARRAYS:
+		offset, length = header['arrays'][name]
+		arrays[name] = view[start + offset:start + offset + length].cast(typecode)
+	return OutlineStore(header['em'], header['names'], arrays)
+
+
+def serializeGlyph(glyph, operation):
+	""" Returns a json serializable dict of the plan operation that produced the
+	glyph passed to it and of its resulting outline """
+	cachedGlyph = dict(operation)
+	foreground = glyph.foreground
+	cachedGlyph['quadratic'] = foreground.is_quadratic
+	cachedGlyph['contours'] = [[
+	contour.closed, contour.is_quadratic,
+	[[point.x, point.y, point.on_curve] for point in contour]]
+	for contour in foreground]
+	return cachedGlyph
+
+
+def insertCachedGlyph(cachedGlyph, targetGlyph):
+	""" Replaces targetGlyph with the outline of a glyph from the glyph cache """
+	targetGlyph.clear()
+	layer = fontforge.layer()
+	# A layer only takes contours of its own order, TrueType ones are quadratic.
+	# Entries stored without the order have it on each contour
+	layer.is_quadratic = cachedGlyph.get('quadratic', any(
+	quadratic for _, quadratic, _ in cachedGlyph['contours']))
+	for closed, quadratic, points in cachedGlyph['contours']:
+		contour = fontforge.contour()
+		contour.is_quadratic = quadratic
+		for x, y, onCurve in points:
+			contour += fontforge.point(x, y, onCurve)
+		contour.closed = closed
+		layer += contour
+	targetGlyph.foreground = layer
+
+
+def loadIconManifest(path):
+	""" Reads an --icons file into an IconManifest. Each line holds one
+	codepoint (U+F015 or 0xF015), the icon character itself or a glyph name of
+	a symbol font (e.g. home), text after # is a comment """
+	codepoints = set()
+	names = set()
+	with open(path, "r", encoding="utf-8") as manifestFile:
+		for line in manifestFile:
+			entry = line.split("#", 1)[0].strip()
+			if not entry:
+				continue
+			if entry[:2].lower() in ("u+", "0x"):
+				try:
+					codepoints.add(int(entry[2:], 16))
+				except ValueError:
+					raise ValueError("Invalid codepoint in {}: {}".format(path, entry))
+			elif len(entry) == 1:
+				codepoints.add(ord(entry))
+			else:
+				names.add(entry)
+	return IconManifest(frozenset(codepoints), frozenset(names))
+
+
+def loadPlan(path):
+	""" Reads a patch plan written by savePlan """
+	with open(path, "r", encoding="utf-8") as planFile:
+		return json.load(planFile)
+
+
+def savePlan(plan, path):
+	""" Writes a patch plan as json, sorted and indented so plans diff well """
+	with open(path, "w", encoding="utf-8") as planFile:
+		json.dump(plan, planFile, indent=1, sort_keys=True)
+
+
+def transferGlyph(symbolGlyph, targetGlyph):
+	""" Replaces targetGlyph with a copy of symbolGlyph, without going through
+	the clipboard or the selection of either font """
+	targetGlyph.clear()
+	targetGlyph.foreground = getGlyphOutline(symbolGlyph)
+	targetGlyph.width = symbolGlyph.width
+	targetGlyph.glyphname = symbolGlyph.glyphname
+
+
+def getGlyphOutline(glyph):
+	""" Returns the foreground layer of the glyph passed to it with any
+	references unlinked, they would point at glyphs of the symbol font """
+	layer = glyph.foreground
+	for reference in glyph.references:
+		referenceLayer = getGlyphOutline(glyph.font[reference[0]])
+		referenceLayer.transform(reference[1])
+		layer += referenceLayer
+	return layer
+
+
+def getFileHash(path):
+	""" Returns the sha256 hex digest of the file at path """
+	fileHash = sha256()
+	with open(path, "rb") as hashFile:
+		for block in iter(lambda: hashFile.read(1 << 20), b""):
+			fileHash.update(block)
+	return fileHash.hexdigest()
 
 
 def replaceFontName(fontName, replacementDict):
@@ -834,16 +2404,11 @@ def getGlyphDimensions(glyph):
 	'width': bbox[2] + (-bbox[0]), 'height': bbox[3] + (-bbox[1]), }
 
 
-def useScaleGlyph(unicodeValue, glyphList):
-	""" Determines whether or not to use scaled glyphs for glyphs in passed glyph_list """
-	for i in glyphList:
-		if isinstance(i, tuple):
-			if i[0] <= unicodeValue <= i[1]:
-				return True
-		else:
-			if unicodeValue == i:
-				return True
-	return False
+def useScaleGlyph(unicodeValue, scaleStarts, scaleEnds):
+	""" Determines whether or not to use scaled glyphs for passed unicodeValue,
+	scaleStarts and scaleEnds being the intervals of a PatchTable """
+	index = bisect_right(scaleStarts, unicodeValue) - 1
+	return index >= 0 and unicodeValue <= scaleEnds[index]
 
 
 def updateProgress(progress):
@@ -865,6 +2430,860 @@ def updateProgress(progress):
 	sys.stdout.flush()
 
 
+def patchFont(args, symFontArgs, session, freshProcess=False):
+	""" Patches args.font and returns a dict describing the result. Errors are
+	returned rather than raised so that one bad font does not abort a batch.
+	Fonts found in the output cache are restored instead of patched. The peak
+	memory use is only recorded with freshProcess, for a process forked to
+	patch this font alone """
+	result = {
+	'font': args.font, 'output': None, 'outputs': [], 'error': None,
+	'traceback': None,
+	'cacheHit': None, 'bytesSaved': 0, 'peakRSS': None}
+	if args.events is not None:
+		writeEvent(args.events, "fontStarted", font=args.font)
+	try:
+		pending = [] # (args, cache key) of the variants to patch
+		for variantArgs in getVariantArgs(args):
+			cacheKey = None
+			if session.outputCache:
+				cacheKey = session.getOutputCacheKey(variantArgs)
+				cached = session.outputCache.restore(cacheKey, args.outputdir)
+				if cached is not None:
+					result['outputs'] += cached[0]
+					result['bytesSaved'] += cached[1]
+					continue
+			pending.append((variantArgs, cacheKey))
+		if session.outputCache:
+			result['cacheHit'] = not pending
+		if pending:
+			if not args.variants:
+				with FontPatcher(args, symFontArgs, session) as patcher:
+					variantOutputs = [patcher.patch()]
+			elif "fork" in multiprocessing.get_all_start_methods():
+				with FontPatcher(args, symFontArgs, session) as patcher:
+					variantOutputs = patcher.patchVariants(
+					[variantArgs for variantArgs, _ in pending])
+			else:
+				# Without fork every variant is patched from scratch
+				variantOutputs = []
+				for variantArgs, _ in pending:
+					with FontPatcher(variantArgs, symFontArgs, session) as patcher:
+						variantOutputs.append(patcher.patch())
+			for (variantArgs, cacheKey), outputs in zip(pending, variantOutputs):
+				result['outputs'] += outputs
+				if cacheKey:
+					session.outputCache.put(cacheKey, outputs)
+		result['output'] = result['outputs'][0]
+	except Exception as exception:
+		result['error'] = "{}: {}".format(type(exception).__name__, exception)
+		result['traceback'] = traceback.format_exc()
+	if freshProcess:
+		# The peak of a process that patched other fonts may be theirs
+		result['peakRSS'] = getPeakRSS()
+	if args.events is not None:
+		writeEvent(args.events, "fontFinished", font=args.font,
+		outputs=result['outputs'], error=result['error'], cacheHit=result['cacheHit'],
+		peakRSS=result['peakRSS'])
+	return result
+
+
+def getErrorResult(font, error, peakRSS=None):
+	""" Returns the result dict (see patchFont) of a font that could not be
+	patched because its worker process failed """
+	return {
+	'font': font, 'output': None, 'outputs': [], 'error': error,
+	'traceback': "", 'cacheHit': None, 'bytesSaved': 0, 'peakRSS': peakRSS}
+
+
+def patchFontJob(job):
+	""" Worker entry point, job is a tuple of (font, args, symFontArgs,
+	freshProcess) (see patchFont). Every font shares the batch session """
+	font, args, symFontArgs, freshProcess = job
+	args = copy(args)
+	args.font = font
+	return patchFont(args, symFontArgs, batchSession, freshProcess)
+
+
+def patchFonts(fonts, args, symFontArgs, journal=None):
+	""" Patches each font in fonts, spread across args.jobs worker processes
+	and started in order. Each result is appended to the journal file if one is
+	given. Returns a list of result dicts (see patchFont) """
+	global batchSession
+	canFork = "fork" in multiprocessing.get_all_start_methods()
+	if args.jobs > 1 and not canFork:
+		sys.stderr.write(
+		"{}: Worker processes need 'fork' on this platform, patching one font at a time\n"
+		.format(PROJECT_NAME))
+	useWorkers = args.jobs > 1 and len(fonts) > 1 and canFork
+	# With limits every font gets a worker process of its own, so that a font
+	# hitting one only fails itself
+	useIsolation = bool(args.maxMemory or args.timeout)
+	if useIsolation and not canFork:
+		sys.stderr.write(
+		"{}: --maxmemory and --timeout need 'fork' on this platform, they are ignored\n"
+		.format(PROJECT_NAME))
+		useIsolation = False
+	if useWorkers:
+		# Progress bars from several workers would interleave on stdout
+		args = copy(args)
+		args.quiet = True
+	# Workers and isolated processes are forked for a single font each
+	jobs = [
+	(font, args, symFontArgs, useWorkers or useIsolation) for font in fonts]
+
+	batchSession = PatchSession(args)
+	results = []
+	try:
+		# Glyph sets patching the same slots would fail every font alike, so they
+		# are reported once. Forked workers inherit the compiled tables
+		try:
+			batchSession.getPatchTables()
+		except ValueError as error:
+			sys.exit("{}: {}".format(PROJECT_NAME, error))
+		if not useWorkers and not useIsolation:
+			for job in jobs:
+				results.append(patchFontJob(job))
+				if journal:
+					appendJournal(journal, results[-1])
+			return results
+
+		# Each worker patches a single font, so the preloaded symbol fonts it
+		# inherits have never been rescaled by a previous font
+		batchSession.preloadSymbolFonts()
+		if useIsolation:
+			finished = patchFontsIsolated(jobs, args.jobs,
+			args.maxMemory * 1024 * 1024, args.timeout)
+		else:
+			finished = patchFontsPool(jobs, args.jobs)
+		for result in finished:
+			if result['error']:
+				print("Failed: {}".format(result['font']))
+			else:
+				print("Generated: {}".format(", ".join(result['outputs'])))
+			results.append(result)
+			if journal:
+				appendJournal(journal, result)
+		return results
+	finally:
+		batchSession.close()
+		batchSession = None
+
+
+def patchFontsPool(jobs, processes):
+	""" Yields the results of jobs (see patchFontJob) as a pool of processes
+	finishes them, each worker patching a single font (maxtasksperchild=1) """
+	with multiprocessing.get_context("fork").Pool(processes,
+	maxtasksperchild=1) as pool:
+		yield from pool.imap_unordered(patchFontJob, jobs)
+
+
+def patchFontsIsolated(jobs, processes, maxMemory, timeout):
+	""" Yields the results of jobs (see patchFontJob) as they finish, each
+	job patched in a forked process of its own with at most processes running
+	at once. Each process leads a process group, so the processes it forks for
+	formats and variants are measured and killed with it. A group using more
+	than maxMemory bytes or running for more than timeout seconds (0 for no
+	limit) is killed, failing only its font """
+	pending = list(reversed(jobs))
+	running = {} # read end of the result pipe: [pid, font, start, data, peakRSS]
+	while pending or running:
+		while pending and len(running) < processes:
+			job = pending.pop()
+			readFd, writeFd = pipe()
+			pid = forkCall(lambda job=job, writeFd=writeFd: write(writeFd,
+			(json.dumps(patchFontJob(job)) + "\n").encode("utf-8")), writeFd, 0, True)
+			close(writeFd)
+			try:
+				# Also set here so the group exists before it is measured or killed
+				os.setpgid(pid, pid)
+			except OSError:
+				pass # the child already set it, or has exited
+			running[readFd] = [pid, job[0], time(), b"", None]
+
+		readable = select.select(list(running), [], [], LIMIT_POLL_INTERVAL)[0]
+		for readFd in readable:
+			worker = running[readFd]
+			data = read(readFd, 1 << 16)
+			if data:
+				worker[3] += data
+				continue
+			# The worker closed its end of the pipe, it is done
+			del running[readFd]
+			close(readFd)
+			status = waitpid(worker[0], 0)[1]
+			try:
+				result = json.loads(worker[3].decode("utf-8"))
+			except ValueError:
+				result = {}
+			if 'font' in result:
+				yield result
+			else:
+				yield getErrorResult(worker[1], result.get('error') or
+				"Worker process exited with status {}".format(status), worker[4])
+
+		for readFd, worker in list(running.items()):
+			error = None
+			rss = getProcessGroupRSS(worker[0])
+			if rss is not None:
+				worker[4] = max(worker[4] or 0, rss)
+				if maxMemory and rss > maxMemory:
+					error = "Used more than {} MB of memory".format(maxMemory // (1024 * 1024))
+			if timeout and time() - worker[2] > timeout:
+				error = "Took longer than {} seconds".format(timeout)
+			if error:
+				os.killpg(worker[0], signal.SIGKILL)
+				waitpid(worker[0], 0)
+				del running[readFd]
+				close(readFd)
+				yield getErrorResult(worker[1], error, worker[4])
+
+
+def getProcessRSS(pid):
+	""" Returns the current resident set size of process pid in bytes, or None
+	where /proc is not available """
+	try:
+		with open("/proc/{}/statm".format(pid), "r") as statmFile:
+			return int(statmFile.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+	except (OSError, ValueError, IndexError):
+		return None
+
+
+def getProcessGroupRSS(pgid):
+	""" Returns the summed resident set size of the processes in process group
+	pgid in bytes, or None where /proc is not available. Pages shared between
+	them count once per process """
+	try:
+		pids = [name for name in listdir("/proc") if name.isdigit()]
+	except OSError:
+		return None
+	total = 0
+	for pid in pids:
+		try:
+			with open("/proc/{}/stat".format(pid), "r") as statFile:
+				# The fields after the command name, which may contain spaces
+				fields = statFile.read().rsplit(")", 1)[1].split()
+		except (OSError, IndexError):
+			continue # the process exited meanwhile
+		if fields[2] == str(pgid):
+			total += getProcessRSS(pid) or 0
+	return total
+
+
+def discoverFonts(directory, excluded=()):
+	""" Returns the font files anywhere below directory, largest first so the
+	long running fonts start early. Directories in excluded (e.g. the output
+	directory) are not searched. Of several files with the same full name
+	only the one with the preferred extension (see FONT_EXTENSIONS) is kept,
+	they would be patched into the same fonts """
+	excluded = {abspath(path) for path in excluded if path}
+	fonts = []
+	for root, dirs, files in walk(directory):
+		dirs[:] = sorted(
+		name for name in dirs if abspath(join(root, name)) not in excluded)
+		for filename in sorted(files):
+			if splitext(filename)[1].lower() in FONT_EXTENSIONS:
+				fonts.append(join(root, filename))
+	fonts.sort(key=lambda font: -getsize(font))
+
+	duplicates = set()
+	fullnames = {} # full name: font kept
+	for font in sorted(fonts,
+	key=lambda font: FONT_EXTENSIONS.index(splitext(font)[1].lower())):
+		fullname = readFullName(font)
+		if fullname is None:
+			continue
+		if fullname in fullnames:
+			print("Skipping {}, it has the same full name as {}".format(font,
+			fullnames[fullname]))
+			duplicates.add(font)
+		else:
+			fullnames[fullname] = font
+	return [font for font in fonts if font not in duplicates]
+
+
+def readFullName(path):
+	""" Returns the full font name of a FontForge .sfd file or the name ID 4
+	of an OpenType, TrueType or WOFF file, or None if the file is not such a
+	font or has no full name. WOFF2 tables need brotli to read, they are not """
+	if splitext(path)[1].lower() == ".sfd":
+		return readSfdFullName(path)
+	try:
+		with SfntFile(path) as font:
+			return font.getNames().get(4)
+	except (OSError, ValueError, struct.error, UnicodeDecodeError):
+		return None
+
+
+def readSfdFullName(path):
+	""" Returns the FullName of a FontForge .sfd file, which comes before the
+	glyphs, or None if it has none """
+	try:
+		with open(path, "r", encoding="utf-8", errors="replace") as sfdFile:
+			for line in sfdFile:
+				if line.startswith("FullName: "):
+					return line[len("FullName: "):].strip()
+				if line.startswith("BeginChars:"):
+					break
+	except OSError:
+		pass
+	return None
+
+
+class SfntFile:
+	""" Reads the cmap, hmtx, name and OS/2 tables of an OpenType, TrueType
+	or WOFF file with struct from a memory map of the file, without fontforge.
+	Raises ValueError for other files """
+
+	def __init__(self, path):
+		with open(path, "rb") as fontFile:
+			self.mapped = mmap.mmap(fontFile.fileno(), 0, access=mmap.ACCESS_READ)
+		self.data = self.mapped # the tables, decompressed for WOFF
+		self.tables = {} # tag: offset
+		signature = self.data[:4]
+		if signature == b"wOFF":
+			self.readWoffTables()
+		elif signature in (b"\0\1\0\0", b"OTTO", b"true"):
+			numTables = struct.unpack_from(">H", self.data, 4)[0]
+			for index in range(numTables):
+				tag, _, offset, _ = struct.unpack_from(">4sLLL", self.data, 12 + 16 * index)
+				self.tables[tag.decode("latin-1")] = offset
+		else:
+			self.close()
+			raise ValueError("{} is not an OpenType, TrueType or WOFF font".format(
+			path))
+
+	def readWoffTables(self):
+		""" Decompresses the tables of a WOFF file into self.data, tables stored
+		smaller than their original length are zlib streams """
+		numTables = struct.unpack_from(">H", self.mapped, 12)[0]
+		tables = bytearray()
+		for index in range(numTables):
+			tag, offset, compLength, origLength, _ = struct.unpack_from(">4sLLLL",
+			self.mapped, 44 + 20 * index)
+			table = self.mapped[offset:offset + compLength]
+			if compLength < origLength:
+				try:
+					table = zlib.decompress(table)
+				except zlib.error as error:
+					raise ValueError("bad {} table: {}".format(tag.decode("latin-1"),
+					error))
+			self.tables[tag.decode("latin-1")] = len(tables)
+			tables += table
+		self.data = bytes(tables)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def close(self):
+		self.mapped.close()
+
+	def getTable(self, tag):
+		""" Returns the offset of table tag, raises ValueError if it is missing """
+		if tag not in self.tables:
+			raise ValueError("no {} table".format(tag))
+		return self.tables[tag]
+
+	def getCmap(self):
+		""" Returns the glyph id of each codepoint, from the format 12 Unicode
+		subtable if there is one and the format 4 one otherwise """
+		data = self.data
+		cmapOffset = self.getTable('cmap')
+		numTables = struct.unpack_from(">H", data, cmapOffset + 2)[0]
+		subtables = {} # format: offset of the first Unicode subtable
+		for index in range(numTables):
+			platformId, encodingId, offset = struct.unpack_from(">HHL", data,
+			cmapOffset + 4 + 8 * index)
+			if platformId == 0 or (platformId == 3 and encodingId in (1, 10)):
+				offset += cmapOffset
+				subtables.setdefault(struct.unpack_from(">H", data, offset)[0], offset)
+		cmap = {}
+		if 12 in subtables:
+			offset = subtables[12]
+			numGroups = struct.unpack_from(">L", data, offset + 12)[0]
+			for start, end, glyphId in struct.iter_unpack(">LLL",
+			data[offset + 16:offset + 16 + 12 * numGroups]):
+				cmap.update(zip(range(start, end + 1), range(glyphId,
+				glyphId + end - start + 1)))
+		elif 4 in subtables:
+			offset = subtables[4]
+			segCount = struct.unpack_from(">H", data, offset + 6)[0] // 2
+			endCodes = struct.unpack_from(">{}H".format(segCount), data, offset + 14)
+			arrays = offset + 16 + 2 * segCount
+			startCodes = struct.unpack_from(">{}H".format(segCount), data, arrays)
+			idDeltas = struct.unpack_from(">{}h".format(segCount), data,
+			arrays + 2 * segCount)
+			rangeOffsets = arrays + 4 * segCount
+			idRangeOffsets = struct.unpack_from(">{}H".format(segCount), data,
+			rangeOffsets)
+			for segment in range(segCount):
+				start = startCodes[segment]
+				end = endCodes[segment]
+				if start == 0xFFFF:
+					continue
+				if idRangeOffsets[segment] == 0:
+					for codepoint in range(start, end + 1):
+						cmap[codepoint] = (codepoint + idDeltas[segment]) & 0xFFFF
+					continue
+				glyphIds = rangeOffsets + 2 * segment + idRangeOffsets[segment]
+				for codepoint in range(start, end + 1):
+					glyphId = struct.unpack_from(">H", data,
+					glyphIds + 2 * (codepoint - start))[0]
+					if glyphId:
+						cmap[codepoint] = (glyphId + idDeltas[segment]) & 0xFFFF
+		# glyph 0 is .notdef, a codepoint mapped to it is missing
+		return {codepoint: glyphId for codepoint, glyphId in cmap.items() if glyphId}
+
+	def getAdvanceWidths(self):
+		""" Returns the advance widths of the glyphs with their own horizontal
+		metrics, the glyphs after them have the width of the last one """
+		numberOfHMetrics = struct.unpack_from(">H", self.data,
+		self.getTable('hhea') + 34)[0]
+		# longHorMetric records of advance width and left side bearing
+		return struct.unpack_from(">{}H".format(2 * numberOfHMetrics), self.data,
+		self.getTable('hmtx'))[::2]
+
+	def getNames(self):
+		""" Returns the name of each name id, preferring the Windows English
+		names over other Windows, Unicode and Macintosh ones """
+		data = self.data
+		nameOffset = self.getTable('name')
+		_, count, stringOffset = struct.unpack_from(">HHH", data, nameOffset)
+		ranked = {} # name id: (rank, name), lower ranks are preferred
+		for index in range(count):
+			platformId, _, languageId, nameId, nameLength, offset = (
+			struct.unpack_from(">6H", data, nameOffset + 6 + 12 * index))
+			if platformId == 3:
+				rank = 0 if languageId == 0x409 else 1
+			elif platformId == 0:
+				rank = 2
+			elif platformId == 1:
+				rank = 3
+			else:
+				continue
+			if nameId in ranked and ranked[nameId][0] <= rank:
+				continue
+			start = nameOffset + stringOffset + offset
+			raw = data[start:start + nameLength]
+			ranked[nameId] = (rank, raw.decode("mac_roman" if platformId == 1 else
+			"utf-16-be"))
+		return {nameId: name for nameId, (_, name) in ranked.items()}
+
+	def getOS2(self):
+		""" Returns the average width and Windows ascent and descent from the
+		OS/2 table """
+		offset = self.getTable('OS/2')
+		xAvgCharWidth = struct.unpack_from(">h", self.data, offset + 2)[0]
+		winAscent, winDescent = struct.unpack_from(">HH", self.data, offset + 74)
+		return {
+		'xAvgCharWidth': xAvgCharWidth, 'winAscent': winAscent,
+		'winDescent': winDescent}
+
+
+def readJournal(path):
+	""" Returns the last entry of each font in the journal at path, keyed by
+	the absolute path of the font. A line cut short by a crash is ignored """
+	entries = {}
+	if not isfile(path):
+		return entries
+	with open(path, "r", encoding="utf-8") as journalFile:
+		for line in journalFile:
+			try:
+				entry = json.loads(line)
+			except ValueError:
+				continue
+			entries[entry['font']] = entry
+	return entries
+
+
+def appendJournal(path, result):
+	""" Appends the outcome of patching a font (see patchFont) to the journal
+	at path, with the size and modification time of the font so that --resume
+	patches it again if it changes """
+	fontStat = stat(result['font'])
+	entry = {
+	'font': abspath(result['font']), 'size': fontStat.st_size,
+	'mtime': fontStat.st_mtime, 'status': 'failed' if result['error'] else 'done',
+	'outputs': result['outputs'], 'error': result['error'],
+	'peakRSS': result['peakRSS'], 'time': round(time(), 6)}
+	with open(path, "a+b") as journalFile:
+		# A run killed while writing leaves a line without its newline, the
+		# entry must not be joined to it
+		if journalFile.seek(0, 2) > 0:
+			journalFile.seek(-1, 2)
+			if journalFile.read(1) != b"\n":
+				journalFile.write(b"\n")
+		journalFile.write((json.dumps(entry, sort_keys=True) + "\n").encode("utf-8"))
+
+
+def getUnfinishedFonts(fonts, journal):
+	""" Returns the fonts the journal entries (see readJournal) do not list as
+	patched, that changed since or whose outputs are gone. Failed fonts are
+	tried again """
+	unfinished = []
+	for font in fonts:
+		entry = journal.get(abspath(font))
+		fontStat = stat(font)
+		if (entry is None or entry['status'] != 'done' or
+		(entry['size'], entry['mtime']) != (fontStat.st_size, fontStat.st_mtime) or
+		not all(isfile(output) for output in entry['outputs'])):
+			unfinished.append(font)
+	return unfinished
+
+
+def getPromisedCodepoints(args):
+	""" Returns the codepoints the enabled patch set entries add for args,
+	read from the cmaps of the symbol fonts. Entries limited by --icons only
+	promise the listed codepoints, glyph names are not resolved """
+	icons = loadIconManifest(args.icons) if args.icons else None
+	symbolCmaps = {}
+	promised = set()
+	for patch in getPatchSet(args):
+		if not patch['Enabled']:
+			continue
+		if patch['Filename'] not in symbolCmaps:
+			with SfntFile(__dir__ + "/src/glyphs/" + patch['Filename']) as symbolFont:
+				symbolCmaps[patch['Filename']] = symbolFont.getCmap()
+		cmap = symbolCmaps[patch['Filename']]
+		if patch['SymStart'] == 0:
+			# every glyph is copied to its own codepoint, see compilePatchTable
+			targets = set(cmap)
+		else:
+			# fontforge selects glyphs, a glyph with several codepoints in the
+			# range is copied once
+			glyphs = {}
+			for codepoint in sorted(cmap):
+				if patch['SymStart'] <= codepoint <= patch['SymEnd']:
+					glyphs.setdefault(cmap[codepoint], codepoint)
+			codepoints = [[codepoint, codepoint] for codepoint in sorted(glyphs.values())]
+			targets = set(compilePatchTable(patch, codepoints).targets.values())
+		if icons:
+			targets &= icons.codepoints
+		promised |= targets
+	return promised
+
+
+def verifyFont(path, args, promised):
+	""" Returns the problems found in the patched font at path: promised
+	codepoints (see getPromisedCodepoints) it lacks, uneven advance widths for
+	--mono, names over 31 characters for --windows and an odd line height
+	for --adjust-line-height """
+	try:
+		with SfntFile(path) as font:
+			cmap = font.getCmap()
+			widths = font.getAdvanceWidths()
+			names = font.getNames()
+			os2 = font.getOS2()
+	except (OSError, ValueError, struct.error, UnicodeDecodeError) as exception:
+		return ["Could not read the font: {}".format(exception)]
+
+	problems = []
+	missing = sorted(promised.difference(cmap))
+	if missing:
+		problems.append("{} promised codepoints are missing: {}{}".format(
+		len(missing), " ".join("U+{:04X}".format(codepoint) for codepoint in missing[:8]),
+		" ..." if len(missing) > 8 else ""))
+	if args.single:
+		# zero width glyphs are marks drawn over the previous glyph
+		advances = {
+		widths[min(glyphId, len(widths) - 1)] for glyphId in cmap.values()} - {0}
+		if len(advances) > 1:
+			problems.append("Advance widths are not uniform: {}".format(
+			", ".join(str(width) for width in sorted(advances)[:8])))
+	if args.windows:
+		for nameId, label in ((1, "Family"), (6, "PostScript"), (16, "Preferred Family")):
+			if len(names.get(nameId, "")) > 31:
+				problems.append("{} name is longer than 31 characters: {}".format(label,
+				names[nameId]))
+	if args.adjustLineHeight and (os2['winAscent'] + os2['winDescent']) % 2:
+		problems.append("Line height {} is odd".format(os2['winAscent'] +
+		os2['winDescent']))
+	return problems
+
+
+def verify(argv):
+	""" `patch.py verify [options] FONT...`: checks fonts patched with the
+	given options without fontforge, see verifyFont. Directories are searched
+	recursively. Returns the exit status """
+	args, _ = parseArguments(argv, verify=True)
+	start = perf_counter()
+	promised = getPromisedCodepoints(args)
+	paths = []
+	for path in args.font:
+		if isdir(path):
+			for root, dirs, files in walk(path):
+				dirs.sort()
+				paths += [
+				join(root, filename) for filename in sorted(files)
+				if splitext(filename)[1].lower() in ('.otf', '.ttf')]
+		else:
+			paths.append(path)
+
+	failed = 0
+	for path in paths:
+		problems = verifyFont(path, args, promised)
+		if problems:
+			failed += 1
+			print("FAIL {}".format(path))
+			for problem in problems:
+				print("  " + problem)
+		elif not args.quiet:
+			print("OK   {}".format(path))
+	print("Verified {} fonts in {:.2f}s, {} failed".format(len(paths),
+	perf_counter() - start, failed))
+	return 1 if failed else 0
+
+
+def preflight(fonts, args, session):
+	""" Reports, without copying any glyph, the slots two enabled patch set
+	entries would both write and, for each of fonts, the slots of each entry
+	the font already has. Returns the exit status, 1 if entries collide or a
+	font can not be opened """
+	preflightSlots = session.getPreflightSlots()
+	owners = {} # slot: name of the first entry writing it
+	collisions = 0
+	for name, slots in preflightSlots:
+		clashes = {} # (name of an earlier entry, careful): slots both write
+		for slot in sorted(slots):
+			if slot in owners:
+				clashes.setdefault((owners[slot], slots[slot]), []).append(slot)
+			else:
+				owners[slot] = name
+		for (other, careful), clashSlots in clashes.items():
+			if careful:
+				# careful glyphs are skipped instead of overwriting, see planGlyphs
+				label = "Skipped: {1} skips {2} slots patched by {0}: {3}{4}"
+			else:
+				collisions += len(clashSlots)
+				label = "Collision: {0} and {1} both patch {2} slots: {3}{4}"
+			print(label.format(other, name, len(clashSlots),
+			" ".join("{:X}".format(slot) for slot in clashSlots[:8]),
+			" ..." if len(clashSlots) > 8 else ""))
+
+	unreadable = 0
+	for font in fonts:
+		print("{}:".format(font))
+		# Like FontPatcher.analyzeSourceFont, only a font missing from the
+		# metrics cache is opened
+		metrics = None
+		cachePath = None
+		if args.metricsCache:
+			cachePath = getMetricsCachePath(args.metricsCache, font)
+			metrics = loadFontMetrics(cachePath)
+		if metrics is None:
+			try:
+				sourceFont = fontforge.open(font)
+			except Exception as exception:
+				unreadable += 1
+				print("  Could not open the font: {}".format(exception))
+				continue
+			try:
+				metrics = analyzeFont(sourceFont)
+			finally:
+				sourceFont.close()
+			if cachePath:
+				saveFontMetrics(metrics, cachePath)
+		for name, slots in preflightSlots:
+			existing = [slot for slot in slots if metrics.hasCodepoint(slot)]
+			skipped = sum(1 for slot in existing if slots[slot])
+			print("  {}: {} slots, {} already in the font ({} replaced, {} skipped)".format(
+			name, len(slots), len(existing), len(existing) - skipped, skipped))
+	print("Preflight: {} fonts, {} colliding slots, {} fonts could not be "
+	"opened".format(len(fonts), collisions, unreadable))
+	return 1 if collisions or unreadable else 0
+
+
+def reportResults(results):
+	""" Prints a summary of a run, returns True if every font was patched """
+	failures = [result for result in results if result['error']]
+	for result in failures:
+		sys.stderr.write(result['traceback'])
+		sys.stderr.write("{}: Failed to patch {}: {}\n".format(PROJECT_NAME,
+		result['font'], result['error']))
+	if len(results) > 1:
+		print("\nPatched {} of {} fonts".format(len(results) - len(failures),
+		len(results)))
+		measured = [result for result in results if result.get('peakRSS')]
+		if measured:
+			largest = max(measured, key=lambda result: result['peakRSS'])
+			print("Peak memory: {:.0f} MB ({})".format(largest['peakRSS'] /
+			(1024 * 1024), largest['font']))
+	cacheResults = [result for result in results if result['cacheHit'] is not None]
+	if cacheResults:
+		hits = [result for result in cacheResults if result['cacheHit']]
+		print("Output cache: {} hits, {} misses, {} bytes saved".format(len(hits),
+		len(cacheResults) - len(hits), sum(result['bytesSaved'] for result in hits)))
+	return not failures
+
+
+def initServeWorker():
+	""" Sends the output of a serve worker to stderr, stdout carries the
+	results of the jobs. Interrupts are left to the serving process """
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+	signal.signal(signal.SIGTERM, signal.SIG_DFL)
+	sys.stdout.flush()
+	dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+
+def serveJob(queuedJob):
+	""" Runs one job of `patch.py serve` in a worker, queuedJob being the job
+	dict and the time it was queued. Returns a json serializable result """
+	job, queuedTime = queuedJob
+	start = time()
+	result = {
+	'id': job.get('id'), 'font': job.get('font'), 'outputs': [], 'error': None,
+	'traceback': None, 'cacheHit': None, 'pid': getpid(),
+	'queuedSeconds': round(start - queuedTime, 6)}
+	try:
+		required = [job['font'], '--outputdir', job.get('outputdir', ".")]
+		args, symFontArgs = parseArguments(required[:1] + list(job.get('options',
+		[])) + required[1:])
+		defaults = parseArguments(required)[0]
+		refused = [
+		dest for dest in sorted(vars(args))
+		if dest not in SERVE_JOB_OPTIONS and getattr(args, dest) != getattr(defaults,
+		dest)]
+		if refused:
+			raise ValueError("Options not allowed in serve jobs: {}".format(
+			", ".join(refused)))
+		args.quiet = True
+		args.jobs = 1
+		session = PatchSession(args)
+		# Symbol fonts opened or rescaled by a job stay open for the next ones
+		session.symbolFonts = residentSymbolFonts
+		result.update(patchFont(args, symFontArgs, session))
+	except SystemExit:
+		# argparse rejected the options, its message went to stderr
+		result['error'] = "Invalid options: {}".format(" ".join(job.get('options',
+		[])))
+	except Exception as exception:
+		result['error'] = "{}: {}".format(type(exception).__name__, exception)
+		result['traceback'] = traceback.format_exc()
+	result['status'] = "error" if result['error'] else "ok"
+	result['seconds'] = round(time() - start, 6)
+	return result
+
+
+def serveStream(inFile, outFile, pool, slots):
+	""" Reads json jobs from inFile, one per line, runs them on pool and writes
+	each result as a json line to outFile as it finishes. slots bounds the jobs
+	queued at once. Returns when every job read has finished """
+	outLock = threading.Lock()
+	pending = []
+
+	def respond(result):
+		with outLock:
+			outFile.write(json.dumps(result, sort_keys=True, default=str) + "\n")
+			outFile.flush()
+
+	def finish(result):
+		slots.release()
+		respond(result)
+
+	for line in inFile:
+		if not line.strip():
+			continue
+		try:
+			job = json.loads(line)
+			if not isinstance(job, dict) or 'font' not in job:
+				raise ValueError("a job is an object with at least a font")
+		except ValueError as exception:
+			respond({'id': None, 'status': "error", 'error': "Invalid job: {}".format(
+			exception)})
+			continue
+		slots.acquire()
+		pending.append(pool.apply_async(serveJob, ((job, time()),), callback=finish,
+		error_callback=lambda exception, job=job: finish({
+		'id': job.get('id'), 'font': job.get('font'), 'status': "error",
+		'error': "{}: {}".format(type(exception).__name__, exception)})))
+	for asyncResult in pending:
+		asyncResult.wait()
+
+
+def serve(argv):
+	""" Runs `patch.py serve`: patches the fonts of json jobs read from stdin
+	or a unix socket on a pool of workers sharing preloaded symbol fonts """
+	parser = ArgumentParser(prog="patch.py serve", description=(
+	'Patch fonts on request. Each line read is a json job like\n'
+	'  {"id": 1, "font": "in/Font.ttf", "outputdir": "out", "options": ["-c", "-s"]}\n'
+	'and each result is written as a json line with the id, status, outputs, '
+	'error and timings'), formatter_class=RawTextHelpFormatter)
+	parser.add_argument('--socket', dest='socket', default=None, type=str,
+	help='Path of a unix socket to accept jobs on instead of stdin')
+	parser.add_argument('-j', '--jobs', dest='jobs', default=0, type=int,
+	help='Number of worker processes (default all cores)')
+	parser.add_argument('--maxjobs', dest='maxJobs', default=20, type=int,
+	help='Jobs a worker runs before it is replaced, to cap memory growth '
+	'(default 20)')
+	parser.add_argument('--queue', dest='queue', default=0, type=int,
+	help='Most jobs queued at once over all workers, reading more waits '
+	'(default 4 per worker)')
+	args = parser.parse_args(argv)
+	if args.jobs < 1:
+		args.jobs = multiprocessing.cpu_count()
+	if args.queue < 1:
+		args.queue = 4 * args.jobs
+	if "fork" not in multiprocessing.get_all_start_methods():
+		sys.exit(PROJECT_NAME + ": patch.py serve needs 'fork' on this platform")
+
+	# Every worker inherits the symbol fonts at their own size, each rescales
+	# them as jobs need
+	glyphsDir = __dir__ + "/src/glyphs"
+	for filename in sorted(listdir(glyphsDir)):
+		if splitext(filename)[1].lower() in (".otf", ".ttf"):
+			residentSymbolFonts[(filename, None)] = fontforge.open(join(glyphsDir,
+			filename))
+
+	# Stop on SIGTERM like on an interrupt, removing the socket
+	signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+	slots = threading.BoundedSemaphore(args.queue)
+	pool = multiprocessing.get_context("fork").Pool(args.jobs,
+	initializer=initServeWorker, maxtasksperchild=args.maxJobs)
+	try:
+		if args.socket is None:
+			serveStream(sys.stdin, sys.stdout, pool, slots)
+			pool.close()
+			pool.join()
+			return
+
+		class JobHandler(socketserver.StreamRequestHandler):
+			def handle(self):
+				serveStream(TextIOWrapper(self.rfile, encoding="utf-8"),
+				TextIOWrapper(self.wfile, encoding="utf-8", write_through=True), pool,
+				slots)
+
+		if exists(args.socket):
+			remove(args.socket)
+		server = socketserver.ThreadingUnixStreamServer(args.socket, JobHandler)
+		server.daemon_threads = True
+		sys.stderr.write("{}: Serving on {}\n".format(PROJECT_NAME, args.socket))
+		try:
+			server.serve_forever()
+		finally:
+			server.server_close()
+			remove(args.socket)
+	except KeyboardInterrupt:
+		pass
+	finally:
+		# Jobs still running when interrupted are abandoned
+		pool.terminate()
+
+
+def checkFontForgeAvailable():
+	""" Exits if the fontforge python modules could not be imported """
+	if psMat is None:
+		sys.exit(PROJECT_NAME + ": FontForge module is probably not installed. "
+		"[See: http://designwithfontforge.com/en-US/Installing_Fontforge.html]")
+	if fontforge is None:
+		sys.exit(PROJECT_NAME + (
+		": FontForge module could not be loaded. Try installing fontforge python bindings "
+		"[e.g. on Linux Debian or Ubuntu: `sudo apt install fontforge python-fontforge`]"
+		))
+
+
 def checkFontForgeMinVersion():
 	""" Verifies installed FontForge version meets minimum requirement. """
 	minimumVersion = 20141231
@@ -883,9 +3302,9 @@ def checkFontForgeMinVersion():
 		sys.exit(1)
 
 
-def setupArgumentsAndRun():
-	""" set up the arguments """
-	symFontArgs = []
+def getArgumentParser(verify=False):
+	""" Returns the argument parser and its group of symbol font options. The
+	parser of `patch.py verify` takes several fonts """
 	parser = ArgumentParser(
 	description=(
 	'Nerd Fonts Font Patcher: patches a given font with programming and development related glyphs\n\n'
@@ -896,8 +3315,13 @@ def setupArgumentsAndRun():
 	), formatter_class=RawTextHelpFormatter)
 
 	# yapf: disable
-	parser.add_argument('font', help='The path to the font to patch or the path '
-	'to the directory (e.g., Inconsolata.otf)')
+	if verify:
+		parser.prog = "patch.py verify"
+		parser.add_argument('font', nargs='+', help='The patched fonts to verify, '
+		'or directories of them. Give the options they were patched with')
+	else:
+		parser.add_argument('font', help='The path to the font to patch or the path '
+		'to the directory (e.g., Inconsolata.otf)')
 	parser.add_argument('-v', '--version', action='version', version=PROJECT_NAME +
 	": %(prog)s (" + VERSION + ")")
 	parser.add_argument('-s', '--mono', '--use-single-width-glyphs',
@@ -908,6 +3332,20 @@ def setupArgumentsAndRun():
 	'(attempt to center powerline separators more evenly)')
 	parser.add_argument('-q', '--quiet', '--shutup', dest='quiet', default=False,
 	action='store_true', help='Do not generate verbose output')
+	parser.add_argument('--progressbars', dest='progressbars', default=None,
+	action='store_true', help='Draw progress bars even when the output is not a '
+	'terminal (by default they are only drawn on a terminal)')
+	parser.add_argument('--no-progressbars', dest='progressbars',
+	action='store_false', help='Print a summary per glyph set instead of '
+	'progress bars')
+	parser.add_argument('--events', dest='events', default=None, type=int,
+	help='File descriptor to write progress events to, one json object per line '
+	'(e.g. --events 3 3>events.jsonl)')
+	parser.add_argument('--variants', dest='variants', default=None, type=str,
+	help='Comma separated variants to produce from one load of the font, each '
+	'being default or a + separated combination of ' + ", ".join(VARIANT_OPTIONS) +
+	' (e.g., default,mono,windows,mono+windows). Options given on the command '
+	'line apply to every variant')
 	parser.add_argument('-w', '--windows', dest='windows', default=False,
 	action='store_true', help='Limit the internal font name to 31 characters '
 	'(for Windows compatibility)')
@@ -915,8 +3353,19 @@ def setupArgumentsAndRun():
 	action='store_true', help='Add all available Glyphs')
 	parser.add_argument('--compat', dest='compat', default=False,
 	action='store_true', help='Force compatibility with nerd font complete sets')
+	parser.add_argument('--icons', dest='icons', default=None, type=str,
+	help='Only patch the icons listed in this file, one codepoint (U+F015), '
+	'icon character or symbol glyph name per line. The icons keep the size they '
+	'have in a full build')
+	parser.add_argument('--dedup', dest='dedup', default=False,
+	action='store_true', help='Store patched glyphs with the same outline as '
+	'an earlier one as a reference to it (smaller TrueType fonts)')
 	parser.add_argument('--careful', dest='careful', default=False,
 	action='store_true', help='Do not overwrite existing glyphs if detected')
+	parser.add_argument('--preflight', dest='preflight', default=False,
+	action='store_true', help='Only report the slots the enabled glyph sets '
+	'would patch that the fonts already have or that two sets share, exit with '
+	'1 on shared slots')
 	parser.add_argument('--removeligs', '--removeligatures',
 	dest='removeligatures', default=False,	action='store_true',
 	help='Removes ligatures specificed in JSON configuration file')
@@ -929,9 +3378,63 @@ def setupArgumentsAndRun():
 	nargs='?', help='Specify a custom symbol font. All new glyphs will be '
 	'copied, with no scaling applied.')
 	parser.add_argument('-ext', '--extension', dest='extension', default="",
-	type=str, nargs='?', help='Change font file type to create (e.g., ttf, otf)')
+	type=str, nargs='?', help='Change font file type to create (e.g., ttf, otf). '
+	'Several comma separated types (e.g., otf,ttf,woff2) are all generated from '
+	'one patched font')
 	parser.add_argument('-out', '--outputdir', dest='outputdir', default=".",
 	type=str, nargs='?', help='The directory to output the patched font file to')
+	parser.add_argument('--mathbackend', dest='mathBackend', default='scalar',
+	choices=('scalar', 'numpy'), help='Compute the glyph placements one glyph '
+	'at a time (scalar) or per glyph set with numpy, same results (default '
+	'scalar)')
+	parser.add_argument('--checktransforms', dest='checkTransforms',
+	default=False, action='store_true', help='Check that each composed glyph '
+	'transform matches the step by step scale and align result')
+	parser.add_argument('--plan-out', dest='planOut', default=None, type=str,
+	help='Write the patch plan (every glyph operation) as json to this file, '
+	'or into this directory as <fullname>.plan.json')
+	parser.add_argument('--plan-in', dest='planIn', default=None, type=str,
+	help='Apply a patch plan written by --plan-out instead of planning, the '
+	'font must have the same metrics')
+	parser.add_argument('--outputcache', dest='outputCache', default=None,
+	type=str, help='Directory to cache patched fonts in, keyed by a hash of the '
+	'font, the options, the symbol fonts and the fontforge version. Unchanged '
+	'fonts are linked from the cache instead of patched again')
+	parser.add_argument('--glyphcache', dest='glyphCache', default=None,
+	type=str, help='Directory to cache scaled and positioned symbol glyphs in, '
+	'reused by fonts with the same em and dimensions')
+	parser.add_argument('--glyphcachesize', dest='glyphCacheSize', default=512,
+	type=int, help='Maximum size of the glyph cache in MB (default 512)')
+	parser.add_argument('--outlinestore', dest='outlineStore', default=None,
+	type=str, help='Directory to keep the glyphs of the symbol fonts in as '
+	'compact memory mapped arrays, read instead of opening the symbol fonts. '
+	'Rebuilt when a symbol font changes')
+	parser.add_argument('--metricscache', dest='metricsCache', default=None,
+	type=str, help='Directory to keep the analyzed glyph metrics of source fonts '
+	'in, keyed by a hash of the font file')
+	parser.add_argument('--profile', dest='profile', default=False,
+	action='store_true', help='Time each stage and glyph set, print a summary '
+	'and write a Chrome trace to <fullname>.trace.json in the output directory')
+	parser.add_argument('--cprofile', dest='cprofile', default=False,
+	action='store_true', help='Like --profile, and also run the glyph sets, '
+	'--mono and generate under cProfile, written to <fullname>.prof')
+	parser.add_argument('--buildprofile', dest='buildProfile', default='release',
+	choices=sorted(GENERATE_FLAGS), help='draft builds a font for previews '
+	'faster: no comment and fontlog tables, hints, instructions or bearing '
+	'corrections of --mono (default release)')
+	parser.add_argument('-j', '--jobs', dest='jobs', default=1, type=int,
+	help='Number of worker processes to patch a directory of fonts with '
+	'(0 uses all cores)')
+	parser.add_argument('--maxmemory', dest='maxMemory', default=0, type=int,
+	help='Patch each font in a process of its own and fail the fonts '
+	'using more than this many MB of memory (needs /proc)')
+	parser.add_argument('--timeout', dest='timeout', default=0, type=float,
+	help='Patch each font in a process of its own and fail the fonts '
+	'taking longer than this many seconds')
+	parser.add_argument('--resume', dest='resume', default=False,
+	action='store_true', help='Only patch the fonts of the directory that the '
+	'journal in the output directory (' + JOURNAL_NAME + ') does not list as '
+	'patched, e.g. after a crash')
 
 	# symbol fonts to include arguments
 	symFontGroup = parser.add_argument_group('Symbol Fonts')
@@ -965,9 +3468,17 @@ def setupArgumentsAndRun():
 	'(https://github.com/erikflowers/weather-icons)')
 
 	# yapf: enable
+	return parser, symFontGroup
 
 
-	args = parser.parse_args()
+def parseArguments(argv=None, verify=False):
+	""" Parses argv (default sys.argv[1:]) into the args namespace and the
+	list of symbol font option aliases """
+	if argv is None:
+		argv = sys.argv[1:]
+	symFontArgs = []
+	parser, symFontGroup = getArgumentParser(verify)
+	args = parser.parse_args(argv)
 
 	# if you add a new font, set it to True here inside the if condition
 	if args.complete:
@@ -992,32 +3503,88 @@ def setupArgumentsAndRun():
 		for symFontArgAliases in symFontArgs:
 			found = False
 			for alias in symFontArgAliases:
-				if alias in sys.argv:
+				if alias in argv:
 					found = True
 			if found is not True:
 				fontComplete = False
 		args.complete = fontComplete
 
+	if args.jobs < 1:
+		args.jobs = multiprocessing.cpu_count()
+
+	if args.mathBackend == 'numpy' and numpy is None:
+		parser.error("--mathbackend numpy needs numpy, try `pip install numpy`")
+
+	if args.resume and (verify or not isdir(args.font)):
+		parser.error("--resume needs a directory of fonts")
+
+	if args.variants:
+		# A list of tuples of variant names, () being the default variant
+		variants = []
+		for variant in args.variants.split(","):
+			names = tuple(name for name in variant.strip().split("+")
+			if name and name != "default")
+			unknown = [name for name in names if name not in VARIANT_OPTIONS]
+			if unknown:
+				parser.error("unknown variant: {}".format(", ".join(unknown)))
+			variants.append(names)
+		args.variants = variants
+		if args.planIn or args.planOut:
+			parser.error("--variants can not be combined with --plan-in or --plan-out")
+
+	if args.icons:
+		try:
+			loadIconManifest(args.icons)
+		except (OSError, ValueError) as exception:
+			parser.error("can not read --icons file: {}".format(exception))
+
+	# A list of extensions, empty to keep the extension of the source font
+	args.extension = [
+	extension.strip().lstrip('.') for extension in (args.extension or "").split(",")
+	if extension.strip()]
+	return args, symFontArgs
+
+
+def setupArgumentsAndRun():
+	""" set up the arguments """
+	args, symFontArgs = parseArguments()
+
 	# for each font:
+	journal = None
 	if isdir(args.font):
-		files = [
-		join(args.font, file) for file in listdir(args.font)
-		if isfile(join(args.font, file))]
-		for file in files:
-			args.font = file
-			patcher = FontPatcher(args, symFontArgs)
-			patcher.patch()
+		# Outputs and caches kept inside the font directory are not fonts to patch
+		files = discoverFonts(args.font, (args.outputdir, args.outputCache,
+		args.glyphCache, args.metricsCache, args.outlineStore, args.planOut))
+		makeSurePathExists(args.outputdir)
+		journal = join(args.outputdir, JOURNAL_NAME)
+		if args.resume:
+			unfinished = getUnfinishedFonts(files, readJournal(journal))
+			print("Resuming: {} of {} fonts already patched".format(
+			len(files) - len(unfinished), len(files)))
+			files = unfinished
 	else:
-		patcher = FontPatcher(args, symFontArgs)
-		patcher.patch()
+		files = [args.font]
+	if args.preflight:
+		session = PatchSession(args)
+		try:
+			sys.exit(preflight(files, args, session))
+		finally:
+			session.close()
+	if not reportResults(patchFonts(files, args, symFontArgs, journal)):
+		sys.exit(1)
 
 
 def main():
 	""" entry point """
+	if sys.argv[1:2] == ["verify"]:
+		sys.exit(verify(sys.argv[2:]))
+	checkFontForgeAvailable()
 	checkFontForgeMinVersion()
-	setupArgumentsAndRun()
+	if sys.argv[1:2] == ["serve"]:
+		serve(sys.argv[2:])
+	else:
+		setupArgumentsAndRun()
 
 
 if __name__ == "__main__":
-	__dir__ = dirname(abspath(__file__))
 	main()